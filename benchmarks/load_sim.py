@@ -0,0 +1,250 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+"""
+Offline load simulation.
+Drives fake messages, voice state updates and economy command contexts
+through the real cogs against a temporary SQLite file, then prints a JSON
+report (events/sec, database calls per event, latency percentiles).
+
+    python benchmarks/load_sim.py --guilds 10 --users 500 --messages 20000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Run from anywhere, like run.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discord.ext import commands
+
+from cogs.economy import Economy
+from cogs.leveling import Leveling
+from core.config import config
+from core.cooldowns import CooldownStore
+from core.metrics import Metrics
+from database import DatabaseManager, SQLiteBackend
+
+# --- Fakes ---
+
+async def _send(*args, **kwargs) -> None:
+    pass
+
+class World:
+    """Fake guilds and members shared by every scenario."""
+    def __init__(self, guilds: int, users: int) -> None:
+        self.channel = SimpleNamespace(id=1, send=_send)
+        self.guilds = [SimpleNamespace(id=1000 + g, shard_id=0) for g in range(guilds)]
+        self.members = [
+            SimpleNamespace(
+                id=10_000 + u,
+                bot=False,
+                mention=f"<@{10_000 + u}>",
+                display_name=f"user{u}",
+                guild=self.guilds[u % guilds],
+            )
+            for u in range(users)
+        ]
+
+    def message(self, member) -> SimpleNamespace:
+        return SimpleNamespace(author=member, guild=member.guild, channel=self.channel, content="hello")
+
+    def voice_state(self, connected: bool) -> SimpleNamespace:
+        return SimpleNamespace(channel=self.channel if connected else None)
+
+    def context(self, member) -> SimpleNamespace:
+        return SimpleNamespace(author=member, guild=member.guild, channel=self.channel, send=_send)
+
+def make_bot(database, metrics) -> SimpleNamespace:
+    # Just the attributes the cogs read
+    return SimpleNamespace(
+        config=config,
+        database=database,
+        metrics=metrics,
+        cooldowns=CooldownStore(database),
+        logger=logging.getLogger("gnbot.benchmark"),
+        guilds=[],
+        is_ready=lambda: False,
+        user=None,
+    )
+
+# --- Measurement ---
+
+class Scenario:
+    """
+    Times each event and counts the database calls made meanwhile.
+    Event latencies only cover the handler, work it hands to a queue is
+    reported separately: the trailing drain and the queue's job latencies.
+    """
+    def __init__(self, name: str, metrics: Metrics) -> None:
+        self.name = name
+        self.metrics = metrics
+        self.samples = []
+        self.drain_seconds = 0.0
+        # Job latencies per scenario, not since the first one
+        for key in [key for key in metrics.histograms if key[0] == "queue"]:
+            del metrics.histograms[key]
+        self._db_calls_before = self._db_calls()
+        self._started = time.perf_counter()
+
+    def _db_calls(self) -> int:
+        return sum(h.calls for (kind, _), h in self.metrics.histograms.items() if kind == "db")
+
+    async def run(self, coroutine) -> None:
+        started = time.perf_counter()
+        await coroutine
+        self.samples.append(time.perf_counter() - started)
+
+    async def drain(self, coroutine) -> None:
+        """Runs trailing work, e.g. emptying the XP queue, outside the event samples."""
+        started = time.perf_counter()
+        await coroutine
+        self.drain_seconds += time.perf_counter() - started
+
+    def result(self) -> dict:
+        # Includes trailing work such as the final XP flush
+        elapsed = time.perf_counter() - self._started
+        db_calls = self._db_calls() - self._db_calls_before
+        events = len(self.samples)
+        samples = sorted(self.samples)
+
+        def percentile(q: float) -> float:
+            return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 if samples else 0.0
+
+        return {
+            "events": events,
+            "seconds": elapsed,
+            "events_per_sec": events / elapsed if elapsed else 0.0,
+            "db_calls": db_calls,
+            "db_calls_per_event": db_calls / events if events else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": samples[-1] * 1000 if samples else 0.0,
+            "drain_ms": self.drain_seconds * 1000,
+            "queue_jobs": {name: summary for (_, name), summary in self.metrics.summary("queue").items()},
+        }
+
+# --- Scenarios ---
+
+async def bench_messages(world, leveling, metrics, count: int) -> dict:
+    scenario = Scenario("messages", metrics)
+    for _ in range(count):
+        await scenario.run(leveling.on_message(world.message(random.choice(world.members))))
+    await scenario.drain(leveling.xp_queue.drain())
+    await scenario.drain(leveling.xp.flush())
+    return scenario.result()
+
+async def bench_voice(world, leveling, metrics, count: int) -> dict:
+    """Join/leave pairs, each session backdated so the leave pays out XP."""
+    scenario = Scenario("voice", metrics)
+    for _ in range(count // 2):
+        member = random.choice(world.members)
+        await scenario.run(leveling.on_voice_state_update(member, world.voice_state(False), world.voice_state(True)))
+        roster = leveling._voice_sessions[member.guild.id]
+        roster.since[roster._slots[member.id]] -= random.randint(60, 1800)
+        await scenario.run(leveling.on_voice_state_update(member, world.voice_state(True), world.voice_state(False)))
+    await scenario.drain(leveling.xp_queue.drain())
+    await scenario.drain(leveling.xp.flush())
+    return scenario.result()
+
+async def bench_economy(world, economy, metrics, count: int) -> dict:
+    results = {}
+    commands_to_run = {
+        "daily": lambda ctx: economy.daily.callback(economy, ctx),
+        "work": lambda ctx: economy.work.callback(economy, ctx),
+        "deposit": lambda ctx: economy.deposit.callback(economy, ctx, str(random.randint(1, 500))),
+        "buy": lambda ctx: economy.buy.callback(economy, ctx, str(world.item_ids[ctx.guild.id])),
+        "buy_bulk": lambda ctx: economy.buy.callback(economy, ctx, str(world.item_ids[ctx.guild.id]), 5),
+    }
+    for name, invoke in commands_to_run.items():
+        scenario = Scenario(name, metrics)
+        on_cooldown = 0
+        for _ in range(count):
+            try:
+                await scenario.run(invoke(world.context(random.choice(world.members))))
+            except commands.CommandOnCooldown:
+                on_cooldown += 1
+        results[name] = {**scenario.result(), "on_cooldown": on_cooldown}
+    return results
+
+async def seed_shop(world, database) -> None:
+    world.item_ids = {}
+    for guild in world.guilds:
+        row = await database.fetch_one(
+            "INSERT INTO shop_items(server_id, name, price, description) VALUES (?, ?, ?, ?) RETURNING item_id",
+            (guild.id, "Cookie", 50, "Benchmark item"),
+        )
+        world.item_ids[guild.id] = row['item_id']
+
+async def main(args) -> dict:
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteBackend(
+            os.path.join(directory, "benchmark.db"),
+            group_commit=args.group_commit,
+            read_pool_size=args.read_pool_size,
+        )
+        database = DatabaseManager(backend)
+        metrics = Metrics()
+        database.metrics = metrics
+        await database.connect()
+        await database.migrate()
+
+        world = World(args.guilds, args.users)
+        bot = make_bot(database, metrics)
+        leveling = Leveling(bot)
+        economy = Economy(bot)
+        if not args.cooldown:
+            # Otherwise most messages are dropped by the 60s XP cooldown
+            leveling._cd = commands.CooldownMapping.from_cooldown(1.0, 0.0, commands.BucketType.user)
+        await seed_shop(world, database)
+
+        scenarios = {}
+        scenarios["messages"] = await bench_messages(world, leveling, metrics, args.messages)
+        scenarios["voice"] = await bench_voice(world, leveling, metrics, args.voice_events)
+        scenarios.update(await bench_economy(world, economy, metrics, args.economy_ops))
+        await database.close()
+
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "scenarios": scenarios,
+        "db": {f"{kind}/{name}": summary for (kind, name), summary in metrics.summary("db").items()},
+        "queues": {name: queue.stats() for name, queue in metrics.queues.items()},
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline GNBot load simulation.")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--users", type=int, default=1000, help="Members, spread across the guilds")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--voice-events", type=int, default=2000)
+    parser.add_argument("--economy-ops", type=int, default=1000, help="Invocations per economy command")
+    parser.add_argument("--group-commit", action="store_true")
+    parser.add_argument("--read-pool-size", type=int, default=4)
+    parser.add_argument("--cooldown", action="store_true", help="Keep the per-user XP cooldown")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
@@ -0,0 +1,89 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+"""
+Micro-benchmark of the per-message overhead for messages that are neither
+commands nor XP-eligible, comparing the old path with the fast path.
+
+    python benchmarks/message_path.py --iterations 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from types import SimpleNamespace
+
+# Run from anywhere, like run.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKEN", "benchmark") # GNBot validates it, nothing connects
+
+from discord.ext import commands
+
+from cogs.leveling import Leveling
+from core.bot import GNBot
+
+async def measure(iterations: int, coroutine_factory) -> dict:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await coroutine_factory()
+    elapsed = time.perf_counter() - started
+    return {"iterations": iterations, "us_per_message": elapsed / iterations * 1e6}
+
+async def main(args) -> dict:
+    bot = GNBot()
+    bot._connection.user = SimpleNamespace(id=1, bot=True) # What login would set
+    leveling = Leveling(bot)
+
+    guild = SimpleNamespace(id=1000, shard_id=0)
+    author = SimpleNamespace(id=42, bot=False, mention="<@42>")
+    message = SimpleNamespace(author=author, guild=guild, content="just chatting", channel=None, _state=bot._connection)
+    old_prefix = commands.when_mentioned_or(bot.config.prefix)
+    new_prefix = bot.command_prefix
+
+    async def before_commands():
+        # Old GNBot.on_message: every message went through process_commands,
+        # which builds the when_mentioned_or() list and a Context
+        bot.shard_metrics.record(0, "message")
+        if message.author == bot.user or message.author.bot:
+            return
+        await bot.process_commands(message)
+
+    async def after_commands():
+        await bot.on_message(message)
+
+    async def leveling_listener():
+        await leveling.on_message(message)
+
+    report = {}
+    bot.command_prefix = old_prefix
+    report["commands_before"] = await measure(args.iterations, before_commands)
+    bot.command_prefix = new_prefix
+    report["commands_after"] = await measure(args.iterations, after_commands)
+
+    # Prime the cooldown so every call below is rate limited
+    leveling.get_ratelimit(message)
+    report["leveling_on_cooldown"] = await measure(args.iterations, leveling_listener)
+    leveling._disabled_guilds.add(guild.id)
+    report["leveling_disabled_guild"] = await measure(args.iterations, leveling_listener)
+    return {"python": platform.python_version(), "parameters": vars(args), "results": report}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-message overhead micro-benchmark.")
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
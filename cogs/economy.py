@@ -10,8 +10,267 @@ from discord.ext import commands
 from discord.ext.commands import Context
 from discord import app_commands
 import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from core.boards import TopBoards
+from database import InsufficientFunds
+
+# --- SHOP CATALOG CACHE ---
+
+ITEMS_PER_PAGE = 10 # Embed fields per /shop items page
+OPTIONS_PER_PAGE = 25 # Discord's select menu limit
+MAX_CART_ITEMS = 25 # Distinct items per /buy
+MAX_QUANTITY = 1000 # Units of one item per /buy
+INVENTORY_CACHE_SIZE = 10000 # Users whose inventories are kept in memory
+RICHEST_SIZE = 10 # Users shown by /richest
+DAILY_COOLDOWN = 86400 # Seconds
+WORK_COOLDOWN = 3600
+
+def _clip(text, limit: int) -> str:
+    text = str(text or "")
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def parse_cart(text: str, quantity: int = 1) -> dict:
+    """
+    Parses "3 5x2, 7" into {item_id: count}. IDs without a count get `quantity`,
+    repeated IDs add up. Raises ValueError with a user-facing message.
+    """
+    cart = {}
+    for token in text.replace(",", " ").split():
+        item_id, _, count = token.lower().partition("x")
+        try:
+            item_id = int(item_id)
+            count = int(count) if count else quantity
+        except ValueError:
+            raise ValueError(f"Invalid item `{_clip(token, 20)}`, use an ID like `3` or `3x2`.")
+        if count < 1:
+            raise ValueError("Quantity must be at least 1.")
+        cart[item_id] = cart.get(item_id, 0) + count
+        if cart[item_id] > MAX_QUANTITY:
+            raise ValueError(f"You can buy at most {MAX_QUANTITY} of an item at once.")
+    if not cart:
+        raise ValueError("Give at least one item ID.")
+    if len(cart) > MAX_CART_ITEMS:
+        raise ValueError(f"You can buy at most {MAX_CART_ITEMS} different items at once.")
+    return cart
+
+class CatalogEntry:
+    """One guild's shop items, with embed and select pages rendered on first use."""
+    def __init__(self, items: list) -> None:
+        self.items = items
+        self.by_id = {item['item_id']: item for item in items}
+        self._pages = None
+        self._option_pages = None
+
+    def pages(self) -> list:
+        """Pre-rendered /shop items embeds."""
+        if self._pages is None:
+            chunks = [self.items[i:i + ITEMS_PER_PAGE] for i in range(0, len(self.items), ITEMS_PER_PAGE)]
+            self._pages = []
+            for number, chunk in enumerate(chunks, 1):
+                embed = discord.Embed(title="🛒 Shop", color=0x2b2d31)
+                for item in chunk:
+                    # Clipped so a full page stays under Discord's 6000 character embed limit
+                    embed.add_field(
+                        name=_clip(f"{item['name']} - ${item['price']:,}", 200),
+                        value=f"{_clip(item['description'], 300)}\nID: `{item['item_id']}`",
+                        inline=False,
+                    )
+                if len(chunks) > 1:
+                    embed.set_footer(text=f"Page {number}/{len(chunks)} • {len(self.items)} items")
+                self._pages.append(embed)
+        return self._pages
+
+    def option_pages(self) -> list:
+        """Select options for the shop manager, OPTIONS_PER_PAGE per page."""
+        if self._option_pages is None:
+            options = [
+                discord.SelectOption(
+                    label=_clip(item['name'], 100),
+                    description=f"${item['price']} - ID: {item['item_id']}",
+                    value=str(item['item_id'])
+                )
+                for item in self.items
+            ]
+            self._option_pages = [options[i:i + OPTIONS_PER_PAGE] for i in range(0, len(options), OPTIONS_PER_PAGE)]
+        return self._option_pages
+
+class ShopCatalog:
+    """
+    Per-guild cache of shop items.
+    Loaded with one query on first use and dropped by invalidate() whenever
+    an item is added, edited or deleted, so browsing and buying don't read
+    the database in between.
+    """
+    def __init__(self, database) -> None:
+        self.database = database
+        self._entries = {} # {guild_id: CatalogEntry}
+        self._generations = {} # {guild_id: int}, bumped by every invalidate()
+        self.hits = 0
+        self.misses = 0
+        # Called as listener(guild_id, item_id) after an item is deleted
+        self.listeners = []
+
+    async def get(self, guild_id: int) -> CatalogEntry:
+        entry = self._entries.get(guild_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        generation = self._generations.get(guild_id, 0)
+        rows = await self.database.get_shop_items(guild_id)
+        entry = CatalogEntry([dict(row) for row in rows])
+        # Don't cache rows read before an invalidate() that ran while we awaited
+        if self._generations.get(guild_id, 0) == generation:
+            self._entries[guild_id] = entry
+        return entry
+
+    def invalidate(self, guild_id: int) -> None:
+        self._entries.pop(guild_id, None)
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+
+    def deleted(self, guild_id: int, item_id: int) -> None:
+        self.invalidate(guild_id)
+        for listener in self.listeners:
+            listener(guild_id, item_id)
+
+class InventoryEntry:
+    """One user's {item_id: quantity}, with pages rendered on first view."""
+    def __init__(self, quantities: dict) -> None:
+        self.quantities = quantities
+        self._pages = None
+        self._rendered_for = None # (CatalogEntry, title) the pages were built from
+
+    def pages(self, catalog: CatalogEntry, title: str) -> list:
+        # Item edits swap the CatalogEntry, so they re-render here without touching this cache
+        if self._pages is None or self._rendered_for[0] is not catalog or self._rendered_for[1] != title:
+            owned = [
+                (catalog.by_id[item_id], quantity)
+                for item_id, quantity in sorted(self.quantities.items())
+                if item_id in catalog.by_id
+            ]
+            chunks = [owned[i:i + ITEMS_PER_PAGE] for i in range(0, len(owned), ITEMS_PER_PAGE)]
+            self._pages = []
+            for number, chunk in enumerate(chunks, 1):
+                embed = discord.Embed(title=title, color=0x2b2d31)
+                for item, quantity in chunk:
+                    embed.add_field(
+                        name=_clip(f"{item['name']} (x{quantity:,})", 200),
+                        value=_clip(item['description'], 300) or "-",
+                        inline=False,
+                    )
+                if len(chunks) > 1:
+                    embed.set_footer(text=f"Page {number}/{len(chunks)} • {len(owned)} items")
+                self._pages.append(embed)
+            self._rendered_for = (catalog, title)
+        return self._pages
+
+class InventoryCache:
+    """
+    Per-user inventory read model, LRU bounded.
+    Loaded with one indexed query on first view, then updated in place by
+    purchases and item deletes, never expired.
+    """
+    def __init__(self, database, max_size: int = INVENTORY_CACHE_SIZE) -> None:
+        self.database = database
+        self.max_size = max_size
+        self._entries = OrderedDict() # {(guild_id, user_id): InventoryEntry}
+        self._generations = {} # {guild_id: int}, bumped by every change
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, guild_id: int, user_id: int) -> InventoryEntry:
+        key = (guild_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        generation = self._generations.get(guild_id, 0)
+        rows = await self.database.get_inventory(user_id, guild_id)
+        entry = InventoryEntry({row['item_id']: row['quantity'] or 1 for row in rows})
+        # Rows read before a purchase or delete committed meanwhile may be stale
+        if self._generations.get(guild_id, 0) == generation:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _changed(self, guild_id: int) -> None:
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+
+    def add(self, guild_id: int, user_id: int, lines: list) -> None:
+        """Applies committed (item_id, quantity, unit_price) purchase lines."""
+        self._changed(guild_id)
+        entry = self._entries.get((guild_id, user_id))
+        if entry is None:
+            return
+        for item_id, quantity, _ in lines:
+            entry.quantities[item_id] = entry.quantities.get(item_id, 0) + quantity
+        entry._pages = None
+
+    def remove_item(self, guild_id: int, item_id: int) -> None:
+        """Drops a deleted item from every cached inventory in the guild."""
+        self._changed(guild_id)
+        for (g, _), entry in self._entries.items():
+            if g == guild_id and entry.quantities.pop(item_id, None) is not None:
+                entry._pages = None
+
+class NetWorthIndex(TopBoards):
+    """
+    Per-guild top-K of [net_worth, user_id], richest first.
+    Seeded once per guild from the net worth index, then kept current from
+    DatabaseManager balance changes, so /richest reads no rows at all.
+    """
+    def __init__(self, size: int = RICHEST_SIZE) -> None:
+        super().__init__(size)
+        self._generations = {} # {guild_id: int}, bumped by every balance change
+
+    def generation(self, guild_id: int) -> int:
+        return self._generations.get(guild_id, 0)
+
+    def seed(self, guild_id: int, rows: list, generation: int) -> list:
+        board = [[row['wallet'] + row['bank'], int(row['user_id'])] for row in rows][:self.size]
+        # A change that landed while the rows were read would be missing, seed again next time
+        if self.generation(guild_id) == generation:
+            super().seed(guild_id, board)
+        return board
+
+    def update(self, guild_id: int, user_id: int, wallet: int, bank: int) -> None:
+        self._generations[guild_id] = self.generation(guild_id) + 1
+        super().update(guild_id, user_id, wallet + bank)
+
+# --- UI COMPONENTS ---
+
+class PagesView(discord.ui.View):
+    """Prev/next buttons over pre-rendered embed pages."""
+    def __init__(self, pages: list):
+        super().__init__(timeout=180)
+        self.pages = pages
+        self.page = 0
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.btn_prev.disabled = self.page == 0
+        self.btn_next.disabled = self.page >= len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, len(self.pages) - 1))
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.pages[self.page], view=self)
 
-# --- UI COMPONENTS FOR SHOP MANAGEMENT ---
+    @discord.ui.button(label="Prev", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def btn_prev(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def btn_next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
 
 # --- MODALS ---
 
@@ -36,6 +295,7 @@ class AddItemModal(discord.ui.Modal, title="Add New Item"):
             "INSERT INTO shop_items(server_id, name, price, description) VALUES (?, ?, ?, ?)",
             (interaction.guild.id, self.emoji_input.value, price, self.name_input.value)
         )
+        self.view_ref.catalog.invalidate(interaction.guild.id)
         
         await interaction.response.send_message(f"✅ Added **{self.name_input.value}** {self.emoji_input.value}.", ephemeral=True)
         # We should refresh the select menu in the parent view
@@ -68,23 +328,17 @@ class EditItemModal(discord.ui.Modal):
             "UPDATE shop_items SET name=?, price=?, description=? WHERE item_id=?",
             (self.name_input.value, new_price, self.desc_input.value, self.item_id)
         )
+        self.view_ref.catalog.invalidate(interaction.guild.id)
         await interaction.response.send_message(f"✅ Item `{self.item_id}` updated.", ephemeral=True)
         # Refresh the parent view if possible (requires re-rendering menu)
 
 class ShopSelect(discord.ui.Select):
-    def __init__(self, items):
-        options = []
-        if items:
-            for item in items[:25]: # Limit 25 for Discord UI
-                options.append(discord.SelectOption(
-                    label=item['name'],
-                    description=f"${item['price']} - ID: {item['item_id']}",
-                    value=str(item['item_id'])
-                ))
-        else:
-            options.append(discord.SelectOption(label="No items", value="none", description="Shop is empty"))
+    def __init__(self, options):
+        disabled = not options
+        if disabled:
+            options = [discord.SelectOption(label="No items", value="none", description="Shop is empty")]
 
-        super().__init__(placeholder="Select an item to manage...", min_values=1, max_values=1, options=options, disabled=(not items))
+        super().__init__(placeholder="Select an item to manage...", min_values=1, max_values=1, options=options, disabled=disabled, row=0)
 
     async def callback(self, interaction: discord.Interaction):
         if self.values[0] == "none":
@@ -92,8 +346,9 @@ class ShopSelect(discord.ui.Select):
             return
             
         item_id = int(self.values[0])
-        # Fetch fresh data
-        item = await self.view.bot.database.fetch_one("SELECT * FROM shop_items WHERE item_id=?", (item_id,))
+        # Served from the catalog cache, which every edit invalidates
+        catalog = await self.view.catalog.get(interaction.guild.id)
+        item = catalog.by_id.get(item_id)
         
         if not item:
             await interaction.response.send_message("Item no longer exists.", ephemeral=True)
@@ -111,32 +366,65 @@ class ShopSelect(discord.ui.Select):
         await interaction.response.edit_message(embed=embed, view=self.view)
 
 class ShopManageView(discord.ui.View):
-    def __init__(self, bot, items):
+    def __init__(self, bot, catalog, entry):
         super().__init__(timeout=180)
         self.bot = bot
-        self.items = items
+        self.catalog = catalog
+        self.option_pages = entry.option_pages()
+        self.page = 0
         self.current_item = None
         
-        self.add_item(ShopSelect(items))
+        self.select = ShopSelect(self.option_pages[0] if self.option_pages else [])
+        self.add_item(self.select)
         
         # Add Item Button (Always visible)
-        self.btn_add = discord.ui.Button(label="Add Item", style=discord.ButtonStyle.success, emoji="➕")
+        self.btn_add = discord.ui.Button(label="Add Item", style=discord.ButtonStyle.success, emoji="➕", row=1)
         self.btn_add.callback = self.on_add
         self.add_item(self.btn_add)
 
         # Edit/Delete Buttons (Initially disabled)
-        self.btn_edit = discord.ui.Button(label="Edit", style=discord.ButtonStyle.primary, disabled=True)
+        self.btn_edit = discord.ui.Button(label="Edit", style=discord.ButtonStyle.primary, disabled=True, row=1)
         self.btn_edit.callback = self.on_edit
         self.add_item(self.btn_edit)
 
-        self.btn_delete = discord.ui.Button(label="Delete", style=discord.ButtonStyle.danger, disabled=True)
+        self.btn_delete = discord.ui.Button(label="Delete", style=discord.ButtonStyle.danger, disabled=True, row=1)
         self.btn_delete.callback = self.on_delete
         self.add_item(self.btn_delete)
 
+        # Page buttons, only when the items don't fit in one select menu
+        if len(self.option_pages) > 1:
+            self.btn_prev = discord.ui.Button(emoji="◀️", style=discord.ButtonStyle.secondary, disabled=True, row=1)
+            self.btn_prev.callback = self.on_prev
+            self.add_item(self.btn_prev)
+
+            self.btn_next = discord.ui.Button(emoji="▶️", style=discord.ButtonStyle.secondary, row=1)
+            self.btn_next.callback = self.on_next
+            self.add_item(self.btn_next)
+
     def enable_buttons(self):
         self.btn_edit.disabled = False
         self.btn_delete.disabled = False
 
+    async def _show_page(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, len(self.option_pages) - 1))
+        self.remove_item(self.select)
+        self.select = ShopSelect(self.option_pages[self.page])
+        self.add_item(self.select)
+        self.btn_prev.disabled = self.page == 0
+        self.btn_next.disabled = self.page >= len(self.option_pages) - 1
+        embed = discord.Embed(
+            title="🔧 Shop Manager",
+            description=f"Use the controls below to manage the shop.\nPage {self.page + 1}/{len(self.option_pages)}",
+            color=0x2b2d31
+        )
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def on_prev(self, interaction: discord.Interaction):
+        await self._show_page(interaction, self.page - 1)
+
+    async def on_next(self, interaction: discord.Interaction):
+        await self._show_page(interaction, self.page + 1)
+
     async def on_add(self, interaction: discord.Interaction):
         await interaction.response.send_modal(AddItemModal(self.bot, self))
 
@@ -155,6 +443,7 @@ class ShopManageView(discord.ui.View):
         if not self.current_item: return
         
         await self.bot.database.execute("DELETE FROM shop_items WHERE item_id=?", (self.current_item['item_id'],))
+        self.catalog.deleted(interaction.guild.id, self.current_item['item_id'])
         await interaction.response.send_message(f"❌ Item `{self.current_item['name']}` deleted.", ephemeral=True)
         self.stop() # Stop view as list is now invalid
 
@@ -163,6 +452,29 @@ class ShopManageView(discord.ui.View):
 class Economy(commands.Cog, name="economy"):
     def __init__(self, bot) -> None:
         self.bot = bot
+        self.catalog = ShopCatalog(bot.database)
+        self.inventories = InventoryCache(bot.database)
+        self.catalog.listeners.append(self.inventories.remove_item)
+        self.richest_index = NetWorthIndex()
+        bot.database.balance_listeners.append(self.richest_index.update)
+
+    async def cog_unload(self) -> None:
+        self.bot.database.balance_listeners.remove(self.richest_index.update)
+
+    @contextmanager
+    def cooldown(self, context: Context, name: str, seconds: float):
+        """
+        Claims a persistent per-member cooldown for the block, raising CommandOnCooldown if it is running.
+        Released again if the block raises, so a failed write doesn't lock the member out.
+        """
+        retry_after = self.bot.cooldowns.claim(name, context.guild.id, context.author.id, seconds)
+        if retry_after:
+            raise commands.CommandOnCooldown(commands.Cooldown(1, seconds), retry_after, commands.BucketType.member)
+        try:
+            yield
+        except BaseException:
+            self.bot.cooldowns.release(name, context.guild.id, context.author.id)
+            raise
 
     async def get_user_balance(self, user_id: int, guild_id: int):
         return await self.bot.database.get_balance(user_id, guild_id)
@@ -184,18 +496,19 @@ class Economy(commands.Cog, name="economy"):
     @commands.hybrid_command(name="daily", description="Collect your daily income.")
     async def daily(self, context: commands.Context) -> None:
         amount = 1000
-        await self.bot.database.update_wallet(context.author.id, context.guild.id, amount)
+        with self.cooldown(context, "daily", DAILY_COOLDOWN):
+            await self.bot.database.update_wallet(context.author.id, context.guild.id, amount)
         embed = discord.Embed(description=f"✅ You collected your daily **${amount}**!", color=0x2b2d31)
         await context.send(embed=embed)
 
     @commands.hybrid_command(name="work", description="Work to earn money.")
-    @commands.cooldown(1, 3600, commands.BucketType.user) 
     async def work(self, context: commands.Context) -> None:
         jobs = [("Developer", 500, 1000), ("Artist", 300, 800), ("Streamer", 100, 2000)]
         job_name, min_pay, max_pay = random.choice(jobs)
         earnings = random.randint(min_pay, max_pay)
         
-        await self.bot.database.update_wallet(context.author.id, context.guild.id, earnings)
+        with self.cooldown(context, "work", WORK_COOLDOWN):
+            await self.bot.database.update_wallet(context.author.id, context.guild.id, earnings)
         embed = discord.Embed(description=f"🔨 You worked as a **{job_name}** and earned **${earnings}**.", color=0x2b2d31)
         await context.send(embed=embed)
         
@@ -207,8 +520,8 @@ class Economy(commands.Cog, name="economy"):
 
     @commands.hybrid_command(name="deposit", description="Deposit money into your bank.")
     async def deposit(self, context: commands.Context, amount: str) -> None:
-        bal = await self.get_user_balance(context.author.id, context.guild.id)
         if amount.lower() == "all":
+            bal = await self.get_user_balance(context.author.id, context.guild.id)
             deposit_amount = bal['wallet']
         else:
             try:
@@ -217,17 +530,20 @@ class Economy(commands.Cog, name="economy"):
                 await context.send("Invalid number.", ephemeral=True)
                 return
         
-        if deposit_amount > bal['wallet'] or deposit_amount <= 0:
+        if deposit_amount <= 0:
             await context.send("Invalid amount.", ephemeral=True)
             return
 
-        await self.bot.database.execute("UPDATE economy_users SET wallet = wallet - ?, bank = bank + ? WHERE user_id=? AND server_id=?", (deposit_amount, deposit_amount, context.author.id, context.guild.id))
+        result = await self.bot.database.adjust_balance(context.author.id, context.guild.id, wallet=-deposit_amount, bank=deposit_amount)
+        if isinstance(result, InsufficientFunds):
+            await context.send("Invalid amount.", ephemeral=True)
+            return
         await context.send(f"✅ Deposited **${deposit_amount}**.")
 
     @commands.hybrid_command(name="withdraw", description="Withdraw money from your bank.")
     async def withdraw(self, context: commands.Context, amount: str) -> None:
-        bal = await self.get_user_balance(context.author.id, context.guild.id)
         if amount.lower() == "all":
+            bal = await self.get_user_balance(context.author.id, context.guild.id)
             amt = bal['bank']
         else:
             try:
@@ -236,13 +552,42 @@ class Economy(commands.Cog, name="economy"):
                 await context.send("Invalid number.", ephemeral=True)
                 return
 
-        if amt > bal['bank'] or amt <= 0:
+        if amt <= 0:
             await context.send("Invalid amount.", ephemeral=True)
             return
 
-        await self.bot.database.execute("UPDATE economy_users SET wallet = wallet + ?, bank = bank - ? WHERE user_id=? AND server_id=?", (amt, amt, context.author.id, context.guild.id))
+        result = await self.bot.database.adjust_balance(context.author.id, context.guild.id, wallet=amt, bank=-amt)
+        if isinstance(result, InsufficientFunds):
+            await context.send("Invalid amount.", ephemeral=True)
+            return
         await context.send(f"✅ Withdrew **${amt}**.")
 
+    async def get_richest(self, guild_id: int) -> list:
+        board = self.richest_index.get(guild_id)
+        if board is None:
+            generation = self.richest_index.generation(guild_id)
+            rows = await self.bot.database.get_richest(guild_id, self.richest_index.size)
+            board = self.richest_index.seed(guild_id, rows, generation)
+        return board
+
+    @commands.hybrid_command(name="richest", description="View the wealthiest members.")
+    async def richest(self, context: Context) -> None:
+        results = await self.get_richest(context.guild.id)
+
+        if not results:
+            await context.send("Nobody has any money yet.")
+            return
+
+        embed = discord.Embed(title="💰 Richest Members", color=0xffd700)
+        desc = ""
+        for i, (net_worth, user_id) in enumerate(results, 1):
+            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"#{i}"
+            # Mentions inside embeds render as names without pinging
+            desc += f"{medal} <@{user_id}>\nNet Worth ${net_worth:,}\n\n"
+
+        embed.description = desc
+        await context.send(embed=embed)
+
     # --- SHOP COMMANDS ---
 
     @commands.hybrid_group(name="shop", description="Shop commands.", invoke_without_command=True)
@@ -253,58 +598,82 @@ class Economy(commands.Cog, name="economy"):
 
     @shop.command(name="items", description="View available items.")
     async def shop_items(self, context: Context) -> None:
-        items = await self.bot.database.fetch_all("SELECT * FROM shop_items WHERE server_id=?", (context.guild.id,))
-        if not items:
+        catalog = await self.catalog.get(context.guild.id)
+        if not catalog.items:
             await context.send("Shop is empty.")
             return
-        embed = discord.Embed(title="🛒 Shop", color=0x2b2d31)
-        for item in items:
-            embed.add_field(name=f"{item['name']} - ${item['price']:,}", value=f"{item['description']}\nID: `{item['item_id']}`", inline=False)
-        await context.send(embed=embed)
+        pages = catalog.pages()
+        if len(pages) == 1:
+            await context.send(embed=pages[0])
+        else:
+            await context.send(embed=pages[0], view=PagesView(pages))
 
     @shop.command(name="manage", description="Admin: Manage shop items (Add/Edit/Delete).")
     @commands.has_permissions(administrator=True)
     async def shop_manage(self, context: Context) -> None:
-        items = await self.bot.database.fetch_all("SELECT * FROM shop_items WHERE server_id=?", (context.guild.id,))
+        catalog = await self.catalog.get(context.guild.id)
         # Allow opening manager even if empty to ADD items
             
-        view = ShopManageView(self.bot, items)
+        view = ShopManageView(self.bot, self.catalog, catalog)
         embed = discord.Embed(title="🔧 Shop Manager", description="Use the controls below to manage the shop.", color=0x2b2d31)
         await context.send(embed=embed, view=view)
 
 
-    @commands.hybrid_command(name="buy", description="Buy an item.")
-    async def buy(self, context: Context, item_id: int) -> None:
-        # Same logic as before, abbreviated for space
-        item = await self.bot.database.fetch_one("SELECT * FROM shop_items WHERE item_id=? AND server_id=?", (item_id, context.guild.id))
-        if not item:
-            await context.send("Item not found.", ephemeral=True)
+    @commands.hybrid_command(name="buy", description="Buy one or more items.")
+    @app_commands.describe(
+        items="Item IDs separated by spaces or commas, optionally with a count (e.g. `3 5x2`).",
+        quantity="How many of each item without its own count (default: 1).",
+    )
+    async def buy(self, context: Context, items: str, quantity: int = 1) -> None:
+        try:
+            cart = parse_cart(items, quantity)
+        except ValueError as e:
+            await context.send(str(e), ephemeral=True)
             return
-        bal = await self.get_user_balance(context.author.id, context.guild.id)
-        if bal['wallet'] < item['price']:
+
+        catalog = await self.catalog.get(context.guild.id)
+        missing = [str(item_id) for item_id in cart if item_id not in catalog.by_id]
+        if missing:
+            await context.send(f"Item not found: {', '.join(missing)}.", ephemeral=True)
+            return
+
+        lines = [(item_id, count, catalog.by_id[item_id]['price']) for item_id, count in cart.items()]
+        # Debit and every inventory change commit together or not at all
+        try:
+            result = await self.bot.database.purchase(context.author.id, context.guild.id, lines)
+        except self.bot.database.integrity_errors as e:
+            # Foreign key violation: an item in the cart was deleted meanwhile
+            self.catalog.invalidate(context.guild.id)
+            self.bot.logger.warning(f"Purchase failed in guild {context.guild.id}: {e}")
+            await context.send("The shop changed while you were buying, please try again.", ephemeral=True)
+            return
+        if isinstance(result, InsufficientFunds):
             await context.send("Not enough money.", ephemeral=True)
             return
+        self.inventories.add(context.guild.id, context.author.id, lines)
 
-        await self.bot.database.execute("UPDATE economy_users SET wallet = wallet - ? WHERE user_id=? AND server_id=?", (item['price'], context.author.id, context.guild.id))
-        
-        existing = await self.bot.database.fetch_one("SELECT id FROM inventory WHERE user_id=? AND item_id=?", (context.author.id, item_id))
-        if existing:
-             await self.bot.database.execute("UPDATE inventory SET quantity = quantity + 1 WHERE id=?", (existing['id'],))
-        else:
-             await self.bot.database.execute("INSERT INTO inventory(user_id, server_id, item_id) VALUES (?, ?, ?)", (context.author.id, context.guild.id, item_id))
-        
-        await context.send(f"🛍️ Bought **{item['name']}**!")
+        receipt = "\n".join(
+            f"`{count}x` {_clip(catalog.by_id[item_id]['name'], 100)} - ${count * price:,}"
+            for item_id, count, price in lines
+        )
+        embed = discord.Embed(title="🛍️ Receipt", description=receipt, color=0x2b2d31)
+        embed.add_field(name="Total", value=f"${sum(count * price for _, count, price in lines):,}", inline=True)
+        embed.add_field(name="💳 Wallet", value=f"${result['wallet']:,}", inline=True)
+        await context.send(embed=embed)
 
     @commands.hybrid_command(name="inventory", description="View your inventory.")
     async def inventory(self, context: Context) -> None:
-        inv = await self.bot.database.fetch_all("SELECT i.quantity, s.name, s.description FROM inventory i JOIN shop_items s ON i.item_id = s.item_id WHERE i.user_id=? AND i.server_id=?", (context.author.id, context.guild.id))
-        if not inv:
+        # Quantities from the read model, names from the catalog: no JOIN per view
+        inventory = await self.inventories.get(context.guild.id, context.author.id)
+        catalog = await self.catalog.get(context.guild.id)
+        pages = inventory.pages(catalog, f"Inventory: {context.author.display_name}")
+        if not pages:
             await context.send("Empty inventory.")
             return
-        embed = discord.Embed(title=f"Inventory: {context.author.display_name}", color=0x2b2d31)
-        for item in inv:
-            embed.add_field(name=f"{item['name']} (x{item['quantity']})", value=item['description'], inline=False)
-        await context.send(embed=embed)
+        if len(pages) == 1:
+            await context.send(embed=pages[0])
+        else:
+            await context.send(embed=pages[0], view=PagesView(pages))
 
 async def setup(bot) -> None:
     await bot.add_cog(Economy(bot))
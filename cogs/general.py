@@ -70,6 +70,15 @@ class General(commands.Cog, name="general"):
             description=f"Latency: **{round(self.bot.latency * 1000)}ms**",
             color=0x2b2d31,
         )
+        shard_id = context.guild.shard_id if context.guild else 0
+        embed.set_footer(text=f"Shard {shard_id} • {self.bot.shard_count or 1} shard(s)")
+        # One line per shard, capped so large bots stay within embed limits
+        lines = [
+            f"`#{sid}` {latency:.0f}ms"
+            for sid, latency, _, _ in self.bot.shard_report()[:20]
+        ]
+        if len(lines) > 1:
+            embed.add_field(name="Shards", value="\n".join(lines), inline=False)
         await context.send(embed=embed)
 
     @commands.hybrid_command(
@@ -91,6 +100,35 @@ class General(commands.Cog, name="general"):
         embed.add_field(
             name="Discord.py Version:", value=f"{discord.__version__}", inline=True
         )
+        report = self.bot.shard_report()
+        workers = None
+        if self.bot.cluster:
+            try:
+                workers = await self.bot.cluster.stats()
+            except Exception:
+                pass # Parent unreachable, fall back to this worker's numbers
+
+        if workers:
+            shards = [shard for worker in workers.values() for shard in worker.get("shards", [])]
+            embed.add_field(name="Servers:", value=f"{sum(w.get('guilds', 0) for w in workers.values()):,}", inline=True)
+            embed.add_field(name="Shards:", value=f"{len(shards)} / {self.bot.shard_count or 1}", inline=True)
+            embed.add_field(name="Events/s:", value=f"{sum(s['events_per_sec'] for s in shards):.1f}", inline=True)
+            alive = sum(1 for w in workers.values() if w.get("alive"))
+            embed.add_field(
+                name="Cluster:", value=f"Worker {self.bot.cluster.worker_id} • {alive}/{len(workers)} workers up", inline=False
+            )
+        else:
+            embed.add_field(name="Servers:", value=f"{len(self.bot.guilds):,}", inline=True)
+            embed.add_field(name="Shards:", value=f"{len(report)} / {self.bot.shard_count or 1}", inline=True)
+            embed.add_field(
+                name="Events/s:", value=f"{sum(rate for _, _, _, rate in report):.1f}", inline=True
+            )
+        lines = [
+            f"`#{sid}` {latency:.0f}ms • {guilds:,} servers • {rate:.1f} ev/s"
+            for sid, latency, guilds, rate in report[:20]
+        ]
+        if lines:
+            embed.add_field(name="Per Shard:", value="\n".join(lines), inline=False)
         embed.set_footer(text=f"Requested by {context.author}")
         await context.send(embed=embed)
 
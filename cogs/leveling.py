@@ -9,109 +9,493 @@ import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
 from datetime import datetime
+import asyncio
 import random
 import time
 
+from core.boards import TopBoards
+from core.scheduler import WorkQueue
+
+class XPAccumulator:
+    """
+    Write-behind buffer for the levels table.
+    Holds absolute XP/level per (guild_id, user_id) in memory and writes
+    dirty rows back with a single batched upsert.
+    Entries are LRU bounded, only clean ones are evicted so no XP is lost.
+    """
+    def __init__(self, database, max_size: int = 50000) -> None:
+        self.database = database
+        self.max_size = max_size
+        self._entries = OrderedDict() # {(guild_id, user_id): [xp, level]}
+        self._dirty = set()
+        self._flushing = set() # Keys being written, evicting them would lose XP if the write fails
+        self._flush_lock = asyncio.Lock()
+        # Called as listener(guild_id, user_id, old_xp, xp, level) after every change.
+        # old_xp is None when the user had no row before.
+        self.listeners = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def dirty_entries(self, guild_id: int) -> list:
+        """Unflushed (user_id, xp, level) rows for one guild."""
+        return [(user_id, *self._entries[(g, user_id)]) for g, user_id in self._dirty if g == guild_id]
+
+    def _notify(self, guild_id: int, user_id: int, old_xp, entry: list) -> None:
+        for listener in self.listeners:
+            listener(guild_id, user_id, old_xp, entry[0], entry[1])
+
+    def _evict(self, keep=None) -> None:
+        """Drops the least recently used clean entries, except keep, until the cache fits."""
+        excess = len(self._entries) - self.max_size
+        if excess <= 0:
+            return
+        victims = []
+        for key in self._entries:
+            if key != keep and key not in self._dirty and key not in self._flushing:
+                victims.append(key)
+                if len(victims) == excess:
+                    break
+        # If everything is dirty the cache stays over size until the next flush
+        for key in victims:
+            del self._entries[key]
+
+    async def _load(self, guild_id: int, user_id: int, create: bool = False):
+        key = (guild_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        data = await self.database.get_level_data(user_id, guild_id)
+        # Another coroutine may have loaded the same user while we awaited
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if data:
+            entry = [data['xp'], data['level']]
+            self._entries[key] = entry
+        elif create:
+            entry = [0, 0]
+            self._entries[key] = entry
+            self._notify(guild_id, user_id, None, entry)
+        else:
+            return None
+        # The caller is about to use this entry, it must stay
+        self._evict(keep=key)
+        return entry
+
+    async def get(self, guild_id: int, user_id: int) -> dict:
+        entry = await self._load(guild_id, user_id)
+        if entry is None:
+            return None
+        return {"xp": entry[0], "level": entry[1]}
+
+    async def add(self, guild_id: int, user_id: int, amount: int, difficulty: int):
+        """Adds XP in memory. Returns the new level on level-up, otherwise None."""
+        entry = await self._load(guild_id, user_id, create=True)
+        old_xp = entry[0]
+        entry[0] += amount
+        self._dirty.add((guild_id, user_id))
+
+        # Formula: XP = difficulty * Level^2
+        # Reverse: Level = sqrt(XP / difficulty)
+        new_level = int((entry[0] / difficulty) ** 0.5)
+        leveled_up = new_level > entry[1]
+        if leveled_up:
+            entry[1] = new_level
+        self._notify(guild_id, user_id, old_xp, entry)
+        return new_level if leveled_up else None
+
+    async def set(self, guild_id: int, user_id: int, xp: int, level: int) -> None:
+        entry = await self._load(guild_id, user_id, create=True)
+        old_xp = entry[0]
+        entry[0] = xp
+        entry[1] = level
+        self._dirty.add((guild_id, user_id))
+        self._notify(guild_id, user_id, old_xp, entry)
+
+    async def flush(self) -> int:
+        """Writes every dirty entry in one transaction. Returns the number of rows written."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            keys, self._dirty = self._dirty, set()
+            rows = [(user_id, guild_id, *self._entries[(guild_id, user_id)]) for guild_id, user_id in keys]
+            self._flushing = keys
+            try:
+                await self.database.upsert_levels(rows)
+            except BaseException:
+                # Keep the rows dirty so the next flush retries them, also when cancelled
+                self._dirty |= keys
+                raise
+            finally:
+                self._flushing = set()
+            self._evict()
+            return len(rows)
+
+class LeaderboardIndex(TopBoards):
+    """
+    Per-guild top-K of [xp, user_id, level], sorted by XP descending.
+    Seeded from the database once per guild and then kept current from
+    XPAccumulator changes, so reads never touch the database.
+    """
+    def __init__(self, size: int = 10) -> None:
+        super().__init__(size)
+
+    def seed(self, guild_id: int, rows: list) -> None:
+        super().seed(guild_id, [[row['xp'], int(row['user_id']), row['level']] for row in rows])
+
+    def update(self, guild_id: int, user_id: int, old_xp, xp: int, level: int) -> None:
+        super().update(guild_id, user_id, xp, level)
+
+class RankIndex:
+    """
+    Per-guild sorted array of XP values, used for O(log n) rank lookups.
+    A user's position is 1 + the number of users with strictly more XP.
+    """
+    def __init__(self) -> None:
+        self._values = {} # {guild_id: array('q') in ascending order}
+
+    def loaded(self, guild_id: int) -> bool:
+        return guild_id in self._values
+
+    def seed(self, guild_id: int, values) -> None:
+        self._values[guild_id] = array('q', sorted(values))
+
+    def update(self, guild_id: int, user_id: int, old_xp, xp: int, level: int) -> None:
+        values = self._values.get(guild_id)
+        if values is None:
+            return
+        if old_xp is not None:
+            i = bisect_left(values, old_xp)
+            if i < len(values) and values[i] == old_xp:
+                del values[i]
+        insort(values, xp)
+
+    def position(self, guild_id: int, xp: int) -> tuple:
+        """Returns (position, ranked_users) for the given XP."""
+        values = self._values[guild_id]
+        return len(values) - bisect_right(values, xp) + 1, len(values)
+
+class VoiceRoster:
+    """
+    Connected members of one guild, stored as parallel arrays.
+    since[i] is the time up to which user_ids[i] has been paid voice XP.
+    """
+    __slots__ = ("user_ids", "since", "_slots")
+
+    def __init__(self) -> None:
+        self.user_ids = array('Q')
+        self.since = array('d')
+        self._slots = {} # {user_id: index}
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def add(self, user_id: int, since: float) -> None:
+        if user_id in self._slots:
+            return
+        self._slots[user_id] = len(self.user_ids)
+        self.user_ids.append(user_id)
+        self.since.append(since)
+
+    def remove(self, user_id: int):
+        """Drops a user and returns their since value, or None if they weren't tracked."""
+        index = self._slots.pop(user_id, None)
+        if index is None:
+            return None
+        since = self.since[index]
+        # Swap the last slot into the hole so removal stays O(1)
+        last = len(self.user_ids) - 1
+        if index != last:
+            moved = self.user_ids[last]
+            self.user_ids[index] = moved
+            self.since[index] = self.since[last]
+            self._slots[moved] = index
+        self.user_ids.pop()
+        self.since.pop()
+        return since
+
+    def collect_due(self, now: float) -> list:
+        """Advances everyone by their full elapsed minutes. Returns [(user_id, minutes)]."""
+        due = []
+        for i in range(len(self.user_ids)):
+            minutes = int((now - self.since[i]) // 60)
+            if minutes >= 1:
+                self.since[i] += minutes * 60
+                due.append((self.user_ids[i], minutes))
+        return due
+
 class Leveling(commands.Cog, name="leveling"):
     def __init__(self, bot) -> None:
         self.bot = bot
         self._cd = commands.CooldownMapping.from_cooldown(1.0, 60.0, commands.BucketType.user) 
-        self._voice_sessions = {} # {user_id: timestamp_joined}
+        self._voice_sessions = {} # {guild_id: VoiceRoster}
+        self._recovered_shards = set() # A shard leaves it on disconnect, voice updates are missed until it's back
+        self._voice_dirty = set() # Guilds whose roster changed since the last snapshot
+        self._disabled_guilds = set() # Guilds with leveling switched off, checked before any other work
+        self._disabled_loaded = False
+        self.xp = XPAccumulator(bot.database, max_size=bot.config.xp_cache_size)
+        self.flush_task.change_interval(seconds=bot.config.xp_flush_interval)
+        self.voice_task.change_interval(seconds=bot.config.voice_xp_tick)
+        self.top = LeaderboardIndex(size=10)
+        self.xp.listeners.append(self.top.update)
+        self.ranks = RankIndex()
+        self.xp.listeners.append(self.ranks.update)
+        self._display_names = {} # {(guild_id, user_id): (text, expires_at)}
+        # XP grants go through a bounded worker pool, grants for a user that is
+        # already queued are merged into one job
+        self.xp_queue = WorkQueue(
+            "xp",
+            self._grant_xp,
+            merge=self._merge_grants,
+            workers=bot.config.xp_queue_workers,
+            max_pending=bot.config.xp_queue_max,
+            policy=bot.config.xp_queue_policy,
+            metrics=bot.metrics,
+        )
+
+    async def cog_load(self) -> None:
+        self.xp_queue.start()
+        self.flush_task.start()
+        self.voice_task.start()
+        if self.bot.is_ready():
+            # Reloaded while connected, on_ready won't fire again
+            await self.load_disabled_guilds()
+            for shard_id in self.bot.shards:
+                await self.recover_voice_sessions(shard_id)
+
+    async def cog_unload(self) -> None:
+        self.flush_task.cancel()
+        self.voice_task.cancel()
+        # Let a write that was cut short put its rows back before the final flush
+        await asyncio.gather(
+            *(task for task in (self.flush_task.get_task(), self.voice_task.get_task()) if task),
+            return_exceptions=True,
+        )
+        # Also runs on bot close, since discord.py unloads every extension there
+        await self.xp_queue.close()
+        if not self.bot.database_ready.is_set():
+            return # Nothing could have been buffered, and there is no schema to write to
+        await self.xp.flush()
+        await self.snapshot_voice_sessions()
+
+    @tasks.loop(seconds=30.0)
+    async def flush_task(self) -> None:
+        try:
+            await self.xp.flush()
+        except Exception as e:
+            self.bot.logger.error(f"Failed to flush XP buffer: {e}")
+
+    @flush_task.before_loop
+    async def before_flush_task(self) -> None:
+        # A loop's first iteration runs immediately, which can be before init_db has migrated
+        await self.bot.database_ready.wait()
 
     def get_ratelimit(self, message: discord.Message):
         bucket = self._cd.get_bucket(message)
         return bucket.update_rate_limit()
 
     async def add_xp(self, user_id: int, guild_id: int, xp_amount: int):
-        data = await self.bot.database.get_level_data(user_id, guild_id)
         settings = await self.bot.database.get_guild_settings(guild_id)
-        
         difficulty = settings['level_difficulty'] # Default 100
 
-        if not data:
-            await self.bot.database.insert_level_user(user_id, guild_id)
-            current_xp = 0
-            current_level = 0
-        else:
-            current_xp = data['xp']
-            current_level = data['level']
-
-        new_xp = current_xp + xp_amount
-        
-        # Formula: XP = difficulty * Level^2
-        # Reverse: Level = sqrt(XP / difficulty)
-        new_level = int((new_xp / difficulty) ** 0.5)
-
-        if new_level > current_level:
-             await self.bot.database.execute(
-                "UPDATE levels SET xp=?, level=? WHERE user_id=? AND server_id=?",
-                (new_xp, new_level, user_id, guild_id)
-            )
-             return new_level
-        else:
-            await self.bot.database.execute(
-                "UPDATE levels SET xp=? WHERE user_id=? AND server_id=?",
-                (new_xp, user_id, guild_id)
-            )
-            return None
+        new_level = await self.xp.add(guild_id, user_id, xp_amount, difficulty)
+        if self.xp.pending >= self.bot.config.xp_flush_threshold:
+            await self.xp.flush()
+        return new_level
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author.bot or not message.guild:
+        # Cheapest checks first, no awaits until the message is known to earn XP
+        if message.author.bot or not message.guild or message.guild.id in self._disabled_guilds:
             return
 
         retry_after = self.get_ratelimit(message)
         if retry_after:
             return 
 
-        # Get Text Multiplier
-        settings = await self.bot.database.get_guild_settings(message.guild.id)
-        multiplier = settings['xp_rate_text']
+        # Rolled here, the guild's text multiplier is applied by the XP worker
+        await self.xp_queue.submit((message.guild.id, message.author.id), [random.randint(15, 25), 0, message])
 
-        xp_gain = random.randint(15, 25) * multiplier
-        new_level = await self.add_xp(message.author.id, message.guild.id, xp_gain)
-        
-        if new_level:
+    @staticmethod
+    def _merge_grants(pending: list, new: list) -> list:
+        # [text_xp, voice_minutes, latest message to announce level-ups in]
+        return [pending[0] + new[0], pending[1] + new[1], new[2] or pending[2]]
+
+    async def _grant_xp(self, key: tuple, grant: list) -> None:
+        guild_id, user_id = key
+        if guild_id in self._disabled_guilds:
+            return # Switched off while the grant was queued
+        text_xp, voice_minutes, message = grant
+        settings = await self.bot.database.get_guild_settings(guild_id)
+        xp_gain = text_xp * settings['xp_rate_text'] + voice_minutes * settings['xp_rate_voice']
+        new_level = await self.add_xp(user_id, guild_id, xp_gain)
+
+        if new_level and message is not None:
             await message.channel.send(f"🎉 {message.author.mention} reached **Level {new_level}**!")
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.load_disabled_guilds()
+
+    async def load_disabled_guilds(self) -> None:
+        rows = await self.bot.database.fetch_all_named("leveling_disabled_guilds")
+        self._disabled_guilds = {int(row['server_id']) for row in rows}
+        self._disabled_loaded = True
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id: int):
+        self._recovered_shards.discard(shard_id)
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        # Fires for every shard before on_ready, and again when one had to identify anew
+        await self.recover_voice_sessions(shard_id)
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id: int):
+        await self.recover_voice_sessions(shard_id)
+
+    async def recover_voice_sessions(self, shard_id: int) -> None:
+        """Reconciles one shard's voice sessions with the live voice states, seeded from the last snapshot."""
+        if shard_id in self._recovered_shards or not self.bot.database_ready.is_set():
+            return
+        self._recovered_shards.add(shard_id)
+        if not self._disabled_loaded:
+            # Shards become ready before on_ready loads these
+            await self.load_disabled_guilds()
+
+        guilds = [guild for guild in self.bot.guilds if guild.shard_id == shard_id]
+        guild_ids = {guild.id for guild in guilds}
+        rows = await self.bot.database.get_voice_sessions()
+        # Unpaid time at snapshot, so the bot's downtime isn't counted
+        unpaid = {
+            (int(row['server_id']), int(row['user_id'])): row['saved_at'] - row['since']
+            for row in rows
+            if int(row['server_id']) in guild_ids
+        }
+        # Rewrite the snapshot of these guilds too, some of those members may be gone
+        self._voice_dirty.update(server_id for server_id, _ in unpaid)
+        now = time.time()
+        for guild in guilds:
+            if guild.id in self._disabled_guilds:
+                continue
+            connected = {
+                member.id
+                for channel in guild.voice_channels + guild.stage_channels
+                for member in channel.members
+                if not member.bot
+            }
+            roster = self._voice_sessions.get(guild.id)
+            if roster is not None:
+                # Left while we weren't listening, when is unknown so only what was paid counts
+                for user_id in [user_id for user_id in roster.user_ids if user_id not in connected]:
+                    roster.remove(user_id)
+                    self._voice_dirty.add(guild.id)
+            for user_id in connected:
+                roster = self._voice_sessions.setdefault(guild.id, VoiceRoster())
+                if user_id not in roster._slots:
+                    roster.add(user_id, now - unpaid.get((guild.id, user_id), 0.0))
+                    self._voice_dirty.add(guild.id)
+
+    async def snapshot_voice_sessions(self) -> None:
+        """Rewrites the snapshot rows of the guilds whose roster changed."""
+        if not self._voice_dirty:
+            return
+        guild_ids, self._voice_dirty = self._voice_dirty, set()
+        now = time.time()
+        rows = []
+        for guild_id in guild_ids:
+            roster = self._voice_sessions.get(guild_id) # None once the guild turned leveling off
+            if roster is not None:
+                rows.extend((user_id, guild_id, roster.since[i], now) for i, user_id in enumerate(roster.user_ids))
+        try:
+            await self.bot.database.replace_voice_sessions(list(guild_ids), rows)
+        except BaseException:
+            self._voice_dirty |= guild_ids
+            raise
+
+    @tasks.loop(seconds=60.0)
+    async def voice_task(self) -> None:
+        """Queues voice XP for everyone connected, then persists sessions."""
+        try:
+            now = time.time()
+            for guild_id, roster in list(self._voice_sessions.items()):
+                if guild_id in self._disabled_guilds:
+                    # Tracked before the switch was known, stop paying for it
+                    del self._voice_sessions[guild_id]
+                    self._voice_dirty.add(guild_id)
+                    continue
+                due = roster.collect_due(now)
+                if due:
+                    self._voice_dirty.add(guild_id)
+                for user_id, minutes in due:
+                    # Same worker pool as text XP, merged with anything already queued for the user
+                    if not await self.xp_queue.submit((guild_id, user_id), [0, minutes, None]):
+                        # Shed by the "drop" policy, leave the minutes unpaid for the next tick
+                        slot = roster._slots.get(user_id)
+                        if slot is not None:
+                            roster.since[slot] -= minutes * 60
+            await self.snapshot_voice_sessions()
+        except Exception as e:
+            self.bot.logger.error(f"Voice XP tick failed: {e}")
+
+    @voice_task.before_loop
+    async def before_voice_task(self) -> None:
+        await self.bot.database_ready.wait()
+
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
-        if member.bot: 
+        if member.bot or member.guild.id in self._disabled_guilds:
             return
 
         now = time.time()
         
         # Case 1: Joined a channel (and wasn't in one before)
         if before.channel is None and after.channel is not None:
-             self._voice_sessions[member.id] = now
+            self._voice_sessions.setdefault(member.guild.id, VoiceRoster()).add(member.id, now)
+            self._voice_dirty.add(member.guild.id)
         
         # Case 2: Left a channel (and isn't in one anymore)
         elif before.channel is not None and after.channel is None:
-            if member.id in self._voice_sessions:
-                joined_at = self._voice_sessions.pop(member.id)
-                duration_seconds = now - joined_at
-                
-                # Minimum 1 minute to get XP
-                if duration_seconds > 60:
-                     minutes = int(duration_seconds / 60)
-                     settings = await self.bot.database.get_guild_settings(member.guild.id)
-                     xp_per_min = settings['xp_rate_voice']
-                     
-                     xp_gain = minutes * xp_per_min
-                     new_level = await self.add_xp(member.id, member.guild.id, xp_gain)
-                     
-                     # Optional: Notify in system channel or DM
-                     # if new_level: ...
+            roster = self._voice_sessions.get(member.guild.id)
+            since = roster.remove(member.id) if roster else None
+            if since is not None:
+                self._voice_dirty.add(member.guild.id)
+                # Ticks already paid up to `since`, award the remaining full minutes
+                minutes = int((now - since) // 60)
+                if minutes >= 1:
+                    await self.xp_queue.submit((member.guild.id, member.id), [0, minutes, None])
 
         # Case 3: Switched channels (Treat as continuous or restart logic depending on preference)
         # Here we treat it as continuous, so we do nothing unless they disconnect.
-        pass
+
+    async def get_rank_position(self, guild_id: int, xp: int) -> tuple:
+        if not self.ranks.loaded(guild_id):
+            await self.xp.flush() # Make buffered XP visible to the query
+            rows = await self.bot.database.fetch_all_named("rank_values", (guild_id,))
+            values = {int(row['user_id']): row['xp'] for row in rows}
+            # Changes buffered while the query ran were not seen by it
+            for user_id, entry_xp, _ in self.xp.dirty_entries(guild_id):
+                values[user_id] = entry_xp
+            self.ranks.seed(guild_id, values.values())
+        return self.ranks.position(guild_id, xp)
 
     @commands.hybrid_command(name="rank", description="Check your rank and XP.")
     async def rank(self, context: Context, user: discord.User = None) -> None:
         target = user or context.author
-        data = await self.bot.database.get_level_data(target.id, context.guild.id)
+        data = await self.xp.get(context.guild.id, target.id)
         settings = await self.bot.database.get_guild_settings(context.guild.id)
         difficulty = settings['level_difficulty']
         
@@ -122,9 +506,11 @@ class Leveling(commands.Cog, name="leveling"):
         xp = data['xp']
         level = data['level']
         next_level_xp = difficulty * ((level + 1) ** 2)
+        position, total = await self.get_rank_position(context.guild.id, xp)
         
         embed = discord.Embed(title=f"Rank: {target.display_name}", color=0x2b2d31)
         embed.set_thumbnail(url=target.display_avatar.url)
+        embed.add_field(name="Rank", value=f"#{position} / {total}", inline=True)
         embed.add_field(name="Level", value=str(level), inline=True)
         embed.add_field(name="XP", value=f"{xp} / {next_level_xp}", inline=True)
         
@@ -135,35 +521,62 @@ class Leveling(commands.Cog, name="leveling"):
         
         await context.send(embed=embed)
 
+    async def get_leaderboard(self, guild_id: int) -> list:
+        board = self.top.get(guild_id)
+        if board is None:
+            await self.xp.flush() # Make buffered XP visible to the query
+            rows = await self.bot.database.fetch_all_named("leaderboard", (guild_id, self.top.size))
+            self.top.seed(guild_id, rows)
+            # Apply anything that was buffered while the query ran
+            for user_id, xp, level in self.xp.dirty_entries(guild_id):
+                self.top.update(guild_id, user_id, None, xp, level)
+            board = self.top.get(guild_id) or []
+        return board
+
+    async def resolve_display_names(self, guild: discord.Guild, user_ids: list) -> dict:
+        """Maps user ids to display text, resolving uncached members in one gateway request."""
+        now = time.monotonic()
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self._display_names.get((guild.id, user_id))
+            if cached and cached[1] > now:
+                names[user_id] = cached[0]
+                continue
+            member = guild.get_member(user_id)
+            if member:
+                names[user_id] = member.mention
+            else:
+                missing.append(user_id)
+
+        if missing:
+            try:
+                for member in await guild.query_members(user_ids=missing, limit=len(missing)):
+                    names[member.id] = member.mention
+            except Exception:
+                pass
+
+        expires_at = now + 300
+        for user_id in user_ids:
+            # Use mention if possible, otherwise ID
+            names.setdefault(user_id, f"User <@{user_id}>")
+            self._display_names[(guild.id, user_id)] = (names[user_id], expires_at)
+        return names
+
     @commands.hybrid_command(name="leaderboard", description="View the top XP leaders.")
     async def leaderboard(self, context: Context) -> None:
-        results = await self.bot.database.fetch_all(
-            "SELECT user_id, level, xp FROM levels WHERE server_id=? ORDER BY xp DESC LIMIT 10",
-            (context.guild.id,)
-        )
+        results = await self.get_leaderboard(context.guild.id)
         
         if not results:
             await context.send("No leveled users yet.")
             return
             
+        names = await self.resolve_display_names(context.guild, [user_id for _, user_id, _ in results])
         embed = discord.Embed(title="🏆 Server Leaderboard", color=0xD4AF37) # Gold
         desc = ""
-        for i, row in enumerate(results, 1):
-            user_id = int(row['user_id'])
-            user = context.guild.get_member(user_id)
-            
-            if not user:
-                # Try to fetch if not in cache
-                try:
-                    user = await context.guild.fetch_member(user_id)
-                except:
-                    pass
-            
-            # Use mention if possible, otherwise Name, otherwise ID
-            display_text = user.mention if user else f"User <@{user_id}>"
-            
+        for i, (xp, user_id, level) in enumerate(results, 1):
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"#{i}"
-            desc += f"{medal} {display_text}\nLevel {row['level']} • {row['xp']:,} XP\n\n"
+            desc += f"{medal} {names[user_id]}\nLevel {level} • {xp:,} XP\n\n"
             
         embed.description = desc
         await context.send(embed=embed)
@@ -176,36 +589,43 @@ class Leveling(commands.Cog, name="leveling"):
 
     @xp.command(name="set", description="Set a user's XP directly.")
     async def xp_set(self, context: Context, user: discord.User, amount: int) -> None:
-        await self.bot.database.insert_level_user(user.id, context.guild.id) # Ensure exists
         # Recalculate level based on new XP
         settings = await self.bot.database.get_guild_settings(context.guild.id)
         difficulty = settings['level_difficulty']
         new_level = int((amount / difficulty) ** 0.5)
         
-        await self.bot.database.execute(
-            "UPDATE levels SET xp=?, level=? WHERE user_id=? AND server_id=?",
-             (amount, new_level, user.id, context.guild.id)
-        )
+        # Go through the buffer so a pending flush can't overwrite the new value
+        await self.xp.set(context.guild.id, user.id, amount, new_level)
+        await self.xp.flush()
         await context.send(f"✅ Set {user.mention}'s XP to {amount} (Level {new_level}).")
 
     @xp.command(name="reset", description="Reset a user's XP to 0.")
     async def xp_reset(self, context: Context, user: discord.User) -> None:
-        await self.bot.database.execute(
-            "UPDATE levels SET xp=0, level=0 WHERE user_id=? AND server_id=?",
-             (user.id, context.guild.id)
-        )
+        await self.xp.set(context.guild.id, user.id, 0, 0)
+        await self.xp.flush()
         await context.send(f"✅ Reset {user.mention}'s XP.")
 
     @xp.command(name="settings", description="Configure XP rates.")
     @app_commands.describe(
         text_rate="Multiplier for text XP (Default: 1)",
         voice_rate="XP per minute in voice (Default: 10)",
-        difficulty="Base XP for Level 1 (Default: 100)"
+        difficulty="Base XP for Level 1 (Default: 100)",
+        enabled="Turn XP on or off for this server (Default: on)"
     )
-    async def xp_settings(self, context: Context, text_rate: int = None, voice_rate: int = None, difficulty: int = None) -> None:
+    async def xp_settings(self, context: Context, text_rate: int = None, voice_rate: int = None, difficulty: int = None, enabled: bool = None) -> None:
         current = await self.bot.database.get_guild_settings(context.guild.id)
         
         changes = []
+        if enabled is not None:
+            await self.bot.database.update_guild_setting(context.guild.id, "leveling_enabled", int(enabled))
+            if enabled:
+                self._disabled_guilds.discard(context.guild.id)
+            else:
+                self._disabled_guilds.add(context.guild.id)
+                # Stop tracking voice time, nothing will be paid for it
+                if self._voice_sessions.pop(context.guild.id, None) is not None:
+                    self._voice_dirty.add(context.guild.id)
+            changes.append(f"Leveling: {'on' if current['leveling_enabled'] else 'off'} -> {'on' if enabled else 'off'}")
         if text_rate:
             await self.bot.database.update_guild_setting(context.guild.id, "xp_rate_text", text_rate)
             changes.append(f"Text Rate: {current['xp_rate_text']} -> {text_rate}")
@@ -221,6 +641,7 @@ class Leveling(commands.Cog, name="leveling"):
             embed.add_field(name="Text Multiplier", value=current['xp_rate_text'])
             embed.add_field(name="Voice XP/Min", value=current['xp_rate_voice'])
             embed.add_field(name="Difficulty Base", value=current['level_difficulty'])
+            embed.add_field(name="Leveling", value="On" if current['leveling_enabled'] else "Off")
             await context.send(embed=embed)
         else:
             await context.send("✅ Updated Settings:\n" + "\n".join(changes))
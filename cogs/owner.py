@@ -61,6 +61,58 @@ class Owner(commands.Cog, name="owner"):
         except Exception as e:
             await context.send(f"Error reloading `{cog}`: {e}")
 
+    @commands.command(name="cachestats", description="Show database cache counters.")
+    @commands.is_owner()
+    async def cachestats(self, context: Context) -> None:
+        stats = self.bot.database.settings_cache_stats()
+        await context.send(
+            f"Guild settings cache: {stats['size']}/{stats['max_size']} entries, "
+            f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)"
+        )
+
+    @commands.command(name="querystats", description="Show named query counters.")
+    @commands.is_owner()
+    async def querystats(self, context: Context) -> None:
+        stats = self.bot.database.query_stats()
+        lines = [
+            f"{name}: {s['calls']} calls, {s['total_ms']:.1f}ms total, {s['avg_ms']:.3f}ms avg"
+            for name, s in sorted(stats.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        ]
+        await context.send("```\n" + "\n".join(lines) + "\n```")
+
+    @commands.command(name="latency", description="Show latency percentiles for commands, listeners and database calls.")
+    @commands.is_owner()
+    async def latency(self, context: Context, kind: str = None) -> None:
+        """
+        Kind: 'command', 'listener', 'db' or empty for all.
+        """
+        summary = self.bot.metrics.summary(kind)
+        if not summary:
+            await context.send("No samples recorded yet.")
+            return
+        lines = [
+            f"{k}/{name}: {s['calls']} calls, p50 {s['p50_ms']:.1f}ms, p95 {s['p95_ms']:.1f}ms, "
+            f"p99 {s['p99_ms']:.1f}ms, {s['error_rate']:.1%} errors"
+            for (k, name), s in sorted(summary.items(), key=lambda item: item[1]['p99_ms'], reverse=True)
+        ]
+        # Stay under Discord's 2000 character message limit
+        text = ""
+        for line in lines:
+            if len(text) + len(line) > 1900:
+                break
+            text += line + "\n"
+        await context.send("```\n" + text + "```")
+
+    @commands.command(name="queuestats", description="Show work queue depth and shed counts.")
+    @commands.is_owner()
+    async def queuestats(self, context: Context) -> None:
+        lines = [
+            f"{name}: depth {s['depth']}/{s['max_pending']}, {s['in_flight']} in flight, {s['submitted']} submitted, "
+            f"{s['coalesced']} coalesced, {s['shed']} shed, {s['errors']} errors"
+            for name, s in ((name, queue.stats()) for name, queue in sorted(self.bot.metrics.queues.items()))
+        ]
+        await context.send("```\n" + ("\n".join(lines) or "No queues.") + "\n```")
+
     @commands.command(name="shutdown", description="Shuts down the bot.")
     @commands.is_owner()
     async def shutdown(self, context: Context) -> None:
@@ -0,0 +1,49 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+class TopBoards:
+    """
+    Per-guild top-K boards of [score, user_id, *extra], highest score first.
+    A board is seeded from the database once, then kept current with update().
+    A user dropping out of a full board discards it, since the next user in
+    line is unknown, and get() returns None until it is seeded again.
+    """
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._boards = {} # {guild_id: [[score, user_id, *extra], ...]}
+
+    def get(self, guild_id: int) -> list:
+        """Returns the board, or None if the guild has to be (re)seeded."""
+        return self._boards.get(guild_id)
+
+    def seed(self, guild_id: int, board: list) -> list:
+        """Stores rows already sorted by score, highest first."""
+        board = board[:self.size]
+        self._boards[guild_id] = board
+        return board
+
+    def update(self, guild_id: int, user_id: int, score: int, *extra) -> None:
+        board = self._boards.get(guild_id)
+        if board is None:
+            return
+
+        for i, entry in enumerate(board):
+            if entry[1] == user_id:
+                if len(board) == self.size and score < board[-1][0]:
+                    # Dropped out of a full board, the next user in line is unknown
+                    del self._boards[guild_id]
+                    return
+                del board[i]
+                break
+        else:
+            if len(board) == self.size and score <= board[-1][0]:
+                return
+
+        i = 0
+        while i < len(board) and board[i][0] >= score:
+            i += 1
+        board.insert(i, [score, user_id, *extra])
+        del board[self.size:]
@@ -5,27 +5,65 @@ Licensed under the Apache License 2.0.
 Based on work by Krypton.
 """
 
+import asyncio
+import functools
 import os
 import platform
 import random
+import time
 import discord
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
 
 from core.logger import setup_logging
+from core.metrics import Metrics, MetricsServer
 from core.config import config
-from database import DatabaseManager
+from core.cooldowns import CooldownStore
+from core.shards import ShardMetrics
+from core.startup import StartupTimer
+from database import DatabaseManager, backend_from_config
 
-class GNBot(commands.Bot):
-    def __init__(self) -> None:
-        pass
+async def _timed_listener(metrics, name: str, coroutine) -> None:
+    started = time.perf_counter()
+    try:
+        await coroutine
+    except Exception:
+        metrics.observe("listener", name, time.perf_counter() - started, error=True)
+        raise # discord.py passes it on to on_error
+    metrics.observe("listener", name, time.perf_counter() - started)
+
+def timed_event(func):
+    """Times a GNBot event method. Cog listeners are timed by GNBot.add_listener."""
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        await _timed_listener(self.metrics, func.__qualname__, func(self, *args, **kwargs))
+    return wrapper
+
+class GNBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids: list = None, shard_count: int = None) -> None:
         # Initialize Logger
-        self.logger = setup_logging()
         self.config = config
+        self.logger = setup_logging(log_file=self.config.log_file, **self.config.logging_options())
         self.config.validate()
 
-        # Database placeholder (will be implemented in Phase 2)
-        self.database = None 
+        self.startup = StartupTimer()
+
+        # Created up front so cogs can hold a reference, connected in init_db
+        self.database = DatabaseManager(self.create_storage_backend(), settings_cache_size=self.config.settings_cache_size)
+        # Set once init_db has connected and migrated, background tasks wait on it
+        self.database_ready = asyncio.Event()
+
+        self.shard_metrics = ShardMetrics()
+        # Latency histograms for commands, listeners and database calls
+        self.metrics = Metrics()
+        self.database.metrics = self.metrics
+        self._timed_listeners = {} # {(event, listener): timing wrapper}, see add_listener()
+        # Command cooldowns that survive restarts, loaded in init_db
+        self.cooldowns = CooldownStore(self.database, flush_interval=self.config.cooldown_flush_interval)
+        self.metrics_server = None
+        self.cluster = None # ClusterClient when running as a cluster worker
+        self._presence_text = {} # {shard_id: text}, what each shard's presence was last set to
+        self._prefixes = None # Built once the bot user is known, see command_prefixes()
 
         # Intents setup
         intents = discord.Intents.default()
@@ -34,49 +72,84 @@ class GNBot(commands.Bot):
         # intents.members = True 
 
         super().__init__(
-            command_prefix=commands.when_mentioned_or(self.config.prefix),
+            command_prefix=lambda bot, message: bot.command_prefixes(),
             intents=intents,
             help_command=None,
+            shard_ids=shard_ids if shard_ids is not None else self.config.shard_ids,
+            shard_count=shard_count if shard_count is not None else self.config.shard_count,
         )
+        self.status_task.change_interval(seconds=self.config.status_interval)
+        self.before_invoke(self._start_command_timer)
 
     async def init_db(self) -> None:
         self.logger.info("Initializing Database...")
-        # Initialize DatabaseManager
-        # Using a file based DB, path relative to project root
-        db_path = f"{os.path.realpath(os.path.dirname(os.path.dirname(__file__)))}/database/database.db"
-        self.database = DatabaseManager(db_path)
-        
-        # Connect and execute schema
+        # Connect and bring the schema up to date
         try:
             await self.database.connect()
-            schema_path = f"{os.path.realpath(os.path.dirname(os.path.dirname(__file__)))}/database/schema.sql"
-            with open(schema_path, "r", encoding="utf-8") as f:
-                schema = f.read()
-                await self.database.connection.executescript(schema)
+            applied = await self.database.migrate()
+            if applied:
+                self.logger.info(f"Applied database migrations: {', '.join(map(str, applied))}")
+            else:
+                self.logger.info("Database schema is current.")
+            await self.database.validate_queries()
+            await self.report_query_plans()
+            if self.config.economy_ledger:
+                await self.database.enable_ledger(
+                    self.config.economy_journal_path,
+                    checkpoint_interval=self.config.economy_checkpoint_interval,
+                    fsync_interval=self.config.economy_journal_fsync_interval,
+                )
+            await self.cooldowns.start()
+            self.database_ready.set()
             self.logger.info("Database initialized and schema updated.")
         except Exception as e:
             self.logger.error(f"Failed to initialize database: {e}")
 
+    def create_storage_backend(self):
+        """Builds the storage backend selected by DB_BACKEND."""
+        return backend_from_config(self.config)
+
+    async def report_query_plans(self) -> None:
+        """Logs the plan of every registered query and warns about full table scans."""
+        for name, plan in (await self.database.explain_queries()).items():
+            for detail, full_scan in plan:
+                if full_scan:
+                    self.logger.warning(f"Query '{name}' does a full table scan: {detail}")
+                else:
+                    self.logger.info(f"Query '{name}': {detail}")
+
     async def load_cogs(self) -> None:
         """
-        Loads all cogs from the cogs directory.
+        Loads all cogs from the cogs directory concurrently.
         """
         cogs_dir = f"{os.path.realpath(os.path.dirname(os.path.dirname(__file__)))}/cogs"
         if not os.path.exists(cogs_dir):
             self.logger.warning(f"Cogs directory not found: {cogs_dir}")
             return
 
-        for file in os.listdir(cogs_dir):
-            if file.endswith(".py") and not file.startswith("__"):
-                extension = file[:-3]
-                try:
-                    await self.load_extension(f"cogs.{extension}")
-                    self.logger.info(f"Loaded extension '{extension}'")
-                except Exception as e:
-                    exception = f"{type(e).__name__}: {e}"
-                    self.logger.error(
-                        f"Failed to load extension {extension}\n{exception}"
-                    )
+        extensions = sorted(
+            file[:-3] for file in os.listdir(cogs_dir)
+            if file.endswith(".py") and not file.startswith("__")
+        )
+        # Cogs don't depend on each other, so their async setup can overlap
+        await asyncio.gather(*(self._load_cog(extension) for extension in extensions))
+
+    async def _load_cog(self, extension: str) -> None:
+        started = time.perf_counter()
+        try:
+            await self.load_extension(f"cogs.{extension}")
+            self.logger.info(f"Loaded extension '{extension}'")
+        except Exception as e:
+            exception = f"{type(e).__name__}: {e}"
+            self.logger.error(
+                f"Failed to load extension {extension}\n{exception}"
+            )
+        finally:
+            self.startup.record(f"cog {extension}", time.perf_counter() - started)
+
+    async def _timed(self, name: str, coroutine) -> None:
+        with self.startup.phase(name):
+            await coroutine
 
     @tasks.loop(minutes=1.0)
     async def status_task(self) -> None:
@@ -84,7 +157,16 @@ class GNBot(commands.Bot):
         Setup the game status task of the bot.
         """
         statuses = ["with GNBot Code", "with Users"]
-        await self.change_presence(activity=discord.Game(random.choice(statuses)))
+        text = random.choice(statuses)
+        for shard_id, shard in self.shards.items():
+            if shard.is_closed():
+                # Set again once it's back, identifying resets the presence
+                self._presence_text.pop(shard_id, None)
+                continue
+            if self._presence_text.get(shard_id) == text:
+                continue # One gateway update per shard, skip the no-op ones
+            await self.change_presence(activity=discord.Game(text), shard_id=shard_id)
+            self._presence_text[shard_id] = text
 
     @status_task.before_loop
     async def before_status_task(self) -> None:
@@ -102,16 +184,116 @@ class GNBot(commands.Bot):
         )
         self.logger.info("-------------------")
         
-        await self.init_db()
-        await self.load_cogs()
+        # Schema setup and cog loading overlap. Cog tasks start right away, so
+        # anything that touches the database waits for database_ready first
+        await asyncio.gather(
+            self._timed("database", self.init_db()),
+            self._timed("cogs (all)", self.load_cogs()),
+        )
+        if self.config.sync_commands:
+            await self._timed("tree sync", self.tree.sync())
         self.status_task.start()
 
+        if self.cluster:
+            try:
+                await self.cluster.start(self)
+                self.logger.info(f"Connected to cluster as worker {self.cluster.worker_id}")
+            except OSError as e:
+                self.logger.warning(f"Cluster IPC unavailable, running standalone: {e}")
+                self.cluster = None
+
+        if self.config.metrics_port:
+            server = MetricsServer(self.metrics, self.config.metrics_host, self.config.metrics_port)
+            try:
+                await server.start()
+                self.metrics_server = server
+                self.logger.info(f"Metrics at http://{self.config.metrics_host}:{self.config.metrics_port}/metrics")
+            except OSError as e:
+                self.logger.warning(f"Metrics endpoint unavailable: {e}")
+
+        self.startup.report(self.logger)
+
+    async def close(self) -> None:
+        # Extensions are unloaded first, so cogs get to flush buffered writes
+        await super().close()
+        if self.cluster:
+            await self.cluster.close()
+        if self.metrics_server:
+            await self.metrics_server.close()
+        await self.cooldowns.close()
+        if self.database:
+            await self.database.close()
+
+    def shard_report(self) -> list:
+        """Per-shard (shard_id, latency_ms, guild_count, events_per_sec) rows."""
+        guild_counts = {}
+        for guild in self.guilds:
+            guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+        return [
+            (
+                shard_id,
+                latency * 1000,
+                guild_counts.get(shard_id, 0),
+                self.shard_metrics.rate(shard_id),
+            )
+            for shard_id, latency in sorted(self.latencies)
+        ]
+
+    def add_listener(self, func, /, name: str = discord.utils.MISSING) -> None:
+        # Cog listeners and bot.listen() register through here, time each one
+        name = func.__name__ if name is discord.utils.MISSING else name
+        qualname = getattr(func, "__qualname__", name)
+
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            await _timed_listener(self.metrics, qualname, func(*args, **kwargs))
+
+        self._timed_listeners[(name, func)] = timed
+        super().add_listener(timed, name)
+
+    def remove_listener(self, func, /, name: str = discord.utils.MISSING) -> None:
+        name = func.__name__ if name is discord.utils.MISSING else name
+        super().remove_listener(self._timed_listeners.pop((name, func), func), name)
+
+    async def _start_command_timer(self, context: Context) -> None:
+        context.metrics_started = time.perf_counter()
+
+    def _record_command(self, context: Context, error: bool) -> None:
+        if context.command is None:
+            return
+        started = getattr(context, "metrics_started", None)
+        # Commands rejected by checks or cooldowns never started, count them without a latency
+        elapsed = time.perf_counter() - started if started is not None else None
+        self.metrics.observe("command", context.command.qualified_name, elapsed, error)
+
+    def command_prefixes(self) -> tuple:
+        """
+        The configured prefix plus the two mention forms, same as
+        when_mentioned_or() but built once instead of on every message.
+        """
+        if self._prefixes is None:
+            if self.user is None:
+                return (self.config.prefix,)
+            self._prefixes = (f"<@{self.user.id}> ", f"<@!{self.user.id}> ", self.config.prefix)
+        return self._prefixes
+
+    @timed_event
     async def on_message(self, message: discord.Message) -> None:
-        if message.author == self.user or message.author.bot:
+        self.shard_metrics.record(message.guild.shard_id if message.guild else 0, "message")
+        if message.author.bot or message.author == self.user:
+            return
+        # Most messages aren't commands, skip building a Context for them
+        if not message.content.startswith(self.command_prefixes()):
             return
         await self.process_commands(message)
 
+    @timed_event
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> None:
+        self.shard_metrics.record(member.guild.shard_id, "voice_state_update")
+
+    @timed_event
     async def on_command_completion(self, context: Context) -> None:
+        self._record_command(context, error=False)
         full_command_name = context.command.qualified_name
         split = full_command_name.split(" ")
         executed_command = str(split[0])
@@ -119,7 +301,9 @@ class GNBot(commands.Bot):
             f"Executed {executed_command} command by {context.author} (ID: {context.author.id})"
         )
 
+    @timed_event
     async def on_command_error(self, context: Context, error) -> None:
+        self._record_command(context, error=True)
         if hasattr(context.command, "on_error"):
             return
 
@@ -0,0 +1,325 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+"""
+Multi-process cluster mode.
+The parent process splits the shards into contiguous ranges, runs one GNBot
+per range in its own worker process and restarts crashed workers with
+backoff. Workers report health to the parent over a Unix socket and can ask
+it for cluster-wide totals.
+
+A guild's events and commands are only ever handled by the worker that owns
+its shard. Per-guild in-memory state (caches, buffers, cooldowns) therefore
+needs no cross-worker invalidation, and workers never write the same rows.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import stat
+import time
+
+import aiohttp
+
+from core.config import config
+from core.logger import setup_logging
+from database import DatabaseManager, backend_from_config
+
+HEALTH_INTERVAL = 10.0 # Seconds between worker health reports
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+STABLE_AFTER = 300.0 # A worker up this long has its backoff reset
+STOP_TIMEOUT = 30.0 # Seconds workers get to close cleanly before they are killed
+
+def shard_ranges(shard_count: int, workers: int) -> list:
+    """Splits shard ids into `workers` contiguous, near-equal ranges."""
+    workers = max(1, min(workers, shard_count))
+    base, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+async def recommended_shard_count(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+# --- Worker side ---
+
+def run_worker(worker_id: int, shard_ids: list, shard_count: int, socket_path: str) -> None:
+    """Process entry point: runs one GNBot for the given shard range."""
+    # Per-worker files so processes don't clobber each other
+    config.log_file = f"discord.worker{worker_id}.log"
+    config.economy_journal_path = f"{config.economy_journal_path}.worker{worker_id}"
+    if config.metrics_port:
+        config.metrics_port += worker_id
+
+    import_started = time.perf_counter()
+    from core.bot import GNBot
+    import_time = time.perf_counter() - import_started
+
+    async def main():
+        bot = GNBot(shard_ids=shard_ids, shard_count=shard_count)
+        bot.startup.record("import", import_time)
+        bot.cluster = ClusterClient(socket_path, worker_id)
+        # The supervisor stops workers with SIGTERM, close cleanly so buffers get flushed
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+        async with bot:
+            await bot.start(config.token)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+class ClusterClient:
+    """Worker-side IPC: pushes health reports and queries cluster totals."""
+    def __init__(self, socket_path: str, worker_id: int) -> None:
+        self.socket_path = socket_path
+        self.worker_id = worker_id
+        self.bot = None
+        self._reader = None
+        self._writer = None
+        self._request_id = 0
+        self._responses = {} # {request_id: future}
+        self._tasks = []
+
+    async def start(self, bot) -> None:
+        self.bot = bot
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        self._tasks = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._health_loop()),
+        ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def health(self) -> dict:
+        report = self.bot.shard_report()
+        return {
+            "worker": self.worker_id,
+            "pid": os.getpid(),
+            "guilds": len(self.bot.guilds),
+            "shards": [
+                {"id": sid, "latency_ms": latency, "guilds": guilds, "events_per_sec": rate}
+                for sid, latency, guilds, rate in report
+            ],
+        }
+
+    async def stats(self, timeout: float = 2.0) -> dict:
+        """Returns the parent's view of every worker: {worker_id: health}."""
+        # Local copy, overlapping calls move self._request_id on
+        request_id = self._request_id = self._request_id + 1
+        future = asyncio.get_running_loop().create_future()
+        self._responses[request_id] = future
+        try:
+            await self._send({"op": "stats", "id": request_id})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._responses.pop(request_id, None)
+
+    async def _send(self, payload: dict) -> None:
+        self._writer.write(json.dumps(payload).encode() + b"\n")
+        await self._writer.drain()
+
+    async def _read_loop(self) -> None:
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            future = self._responses.get(message.get("id"))
+            if future and not future.done():
+                future.set_result(message["workers"])
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self._send({"op": "health", "data": self.health()})
+            except Exception as e:
+                self.bot.logger.warning(f"Cluster health report failed: {e}")
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+# --- Parent side ---
+
+class ClusterSupervisor:
+    """Spawns, watches and restarts the worker processes."""
+    def __init__(self, workers: int, shard_count: int, socket_path: str) -> None:
+        self.logger = setup_logging(log_file="discord.cluster.log", **config.logging_options())
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, workers)
+        self.socket_path = socket_path
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = {} # {worker_id: Process}
+        self._started_at = {} # {worker_id: monotonic start}
+        self._backoff = {} # {worker_id: seconds}
+        self._restart_at = {} # {worker_id: monotonic time of next restart}
+        self.restarts = {} # {worker_id: count}
+        self.health = {} # {worker_id: last health report}
+        self._stopping = False
+
+    async def run(self) -> None:
+        self._remove_stale_socket()
+        await self.migrate_database()
+        server = await asyncio.start_unix_server(self._handle_worker, path=self.socket_path)
+        self.logger.info(f"Cluster: {len(self.ranges)} workers for {self.shard_count} shards")
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            # docker stop / systemd send SIGTERM, workers must not outlive us
+            loop.add_signal_handler(signum, self._request_stop, signum)
+        try:
+            for worker_id in range(len(self.ranges)):
+                self._spawn(worker_id)
+            while not self._stopping:
+                self._check_workers()
+                await asyncio.sleep(1.0)
+        finally:
+            await self.stop()
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def _request_stop(self, signum: int) -> None:
+        self.logger.info(f"Received {signal.Signals(signum).name}, stopping workers")
+        self._stopping = True
+
+    def _remove_stale_socket(self) -> None:
+        """Removes a socket left behind by a supervisor that died, but nothing else."""
+        try:
+            mode = os.stat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise RuntimeError(f"{self.socket_path} exists and is not a socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except ConnectionRefusedError:
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"Another supervisor is listening on {self.socket_path}")
+
+    async def migrate_database(self) -> None:
+        """Migrates the shared database once, so workers don't race on the same steps at startup."""
+        database = DatabaseManager(backend_from_config(config))
+        try:
+            await database.connect()
+            applied = await database.migrate()
+            if applied:
+                self.logger.info(f"Applied database migrations: {', '.join(map(str, applied))}")
+        except Exception as e:
+            # Workers log the same failure from their own init_db
+            self.logger.error(f"Failed to migrate database: {e}")
+        finally:
+            await database.close()
+
+    async def stop(self) -> None:
+        """Sends SIGTERM to every worker, waits up to STOP_TIMEOUT, then kills the rest."""
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for process in self._processes.values():
+            # In a thread, so health reports are still served meanwhile
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+        for worker_id, process in self._processes.items():
+            if process.is_alive():
+                self.logger.warning(f"Worker {worker_id} didn't stop within {STOP_TIMEOUT:.0f}s, killing it")
+                process.kill()
+                await asyncio.to_thread(process.join, 5.0)
+
+    def _spawn(self, worker_id: int) -> None:
+        shard_ids = self.ranges[worker_id]
+        process = self._context.Process(
+            target=run_worker,
+            args=(worker_id, shard_ids, self.shard_count, self.socket_path),
+            name=f"gnbot-worker-{worker_id}",
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._started_at[worker_id] = time.monotonic()
+        self.logger.info(f"Started worker {worker_id} (pid {process.pid}) for shards {shard_ids[0]}-{shard_ids[-1]}")
+
+    def _check_workers(self) -> None:
+        now = time.monotonic()
+        for worker_id, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+
+            restart_at = self._restart_at.get(worker_id)
+            if restart_at is None:
+                # Just noticed the crash, schedule a restart with backoff
+                uptime = now - self._started_at[worker_id]
+                backoff = BACKOFF_BASE if uptime >= STABLE_AFTER else min(self._backoff.get(worker_id, 0) * 2 or BACKOFF_BASE, BACKOFF_MAX)
+                self._backoff[worker_id] = backoff
+                self._restart_at[worker_id] = now + backoff
+                self.health.pop(worker_id, None)
+                self.logger.warning(
+                    f"Worker {worker_id} exited with code {process.exitcode}, restarting in {backoff:.0f}s"
+                )
+            elif now >= restart_at:
+                del self._restart_at[worker_id]
+                self.restarts[worker_id] = self.restarts.get(worker_id, 0) + 1
+                self._spawn(worker_id)
+
+    def cluster_stats(self) -> dict:
+        return {
+            str(worker_id): {
+                **self.health.get(worker_id, {}),
+                "alive": process.is_alive(),
+                "restarts": self.restarts.get(worker_id, 0),
+            }
+            for worker_id, process in self._processes.items()
+        }
+
+    async def _handle_worker(self, reader, writer) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+                if message.get("op") == "health":
+                    data = message["data"]
+                    self.health[data["worker"]] = data
+                elif message.get("op") == "stats":
+                    writer.write(json.dumps({"id": message["id"], "workers": self.cluster_stats()}).encode() + b"\n")
+                    await writer.drain()
+        except (ConnectionError, json.JSONDecodeError):
+            return
+        finally:
+            writer.close()
+
+def run_cluster() -> None:
+    """Entry point for cluster mode, called from run.py."""
+    shard_count = config.shard_count
+    if shard_count is None:
+        shard_count = asyncio.run(recommended_shard_count(config.token))
+
+    supervisor = ClusterSupervisor(config.cluster_workers, shard_count, config.cluster_socket)
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        # Interrupted before the signal handlers were installed
+        asyncio.run(supervisor.stop())
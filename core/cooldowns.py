@@ -0,0 +1,153 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+
+logger = logging.getLogger("gnbot")
+
+class CooldownStore:
+    """
+    Restart-safe per-member command cooldowns.
+    Expiry times live in a dict for O(1) checks and in a min-heap so expired
+    entries can be swept in batches. New cooldowns are written behind with one
+    batched upsert per flush interval and loaded back on start, so a restart
+    only forgets the last few seconds of them.
+    """
+    def __init__(self, database, flush_interval: float = 5.0, sweep_batch: int = 1000) -> None:
+        self.database = database
+        self.flush_interval = flush_interval
+        self.sweep_batch = sweep_batch # Expired entries dropped per pass before yielding
+
+        self._expires = {} # {(name, server_id, user_id): expires_at in epoch seconds}
+        self._heap = [] # [(expires_at, key)], entries that no longer match _expires are skipped
+        self._dirty = set() # Keys not yet written
+        self._released = set() # Keys ended early whose rows may still exist
+        self._expired_since_delete = 0
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    async def start(self) -> None:
+        """Loads the cooldowns that are still running, then starts the flush timer."""
+        for row in await self.database.get_cooldowns(time.time()):
+            key = (row['name'], int(row['server_id']), int(row['user_id']))
+            # Keep anything claimed in memory before we got here
+            if row['expires_at'] > self._expires.get(key, 0.0):
+                self._expires[key] = row['expires_at']
+                self._heap.append((row['expires_at'], key))
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is None:
+            return # Never started, the database isn't usable
+        self._task.cancel()
+        # Let a flush that was cut short put its keys back first
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    def retry_after(self, name: str, server_id: int, user_id: int) -> float:
+        """Seconds until the cooldown ends, 0.0 if it isn't running."""
+        expires_at = self._expires.get((name, server_id, user_id))
+        if expires_at is None:
+            return 0.0
+        return max(0.0, expires_at - time.time())
+
+    def claim(self, name: str, server_id: int, user_id: int, seconds: float) -> float:
+        """
+        Starts the cooldown unless it is already running.
+        Returns 0.0 if it was started, otherwise the seconds left.
+        """
+        remaining = self.retry_after(name, server_id, user_id)
+        if remaining:
+            return remaining
+        key = (name, server_id, user_id)
+        expires_at = time.time() + seconds
+        self._expires[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+        self._dirty.add(key)
+        self._released.discard(key)
+        return 0.0
+
+    def release(self, name: str, server_id: int, user_id: int) -> None:
+        """Ends a cooldown early, e.g. because the command it guarded failed."""
+        key = (name, server_id, user_id)
+        if self._expires.pop(key, None) is None:
+            return
+        # Its heap entry no longer matches _expires and is skipped by sweep()
+        if key in self._dirty:
+            self._dirty.discard(key) # Never written
+        else:
+            self._released.add(key)
+
+    def sweep(self, now: float = None) -> int:
+        """Drops up to sweep_batch expired entries. Returns how many were dropped."""
+        now = time.time() if now is None else now
+        dropped = 0
+        while self._heap and self._heap[0][0] <= now and dropped < self.sweep_batch:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._expires.get(key) != expires_at:
+                continue # Outdated heap entry, the key was claimed again
+            del self._expires[key]
+            # Expired before it was written, the table never needs to see it
+            self._dirty.discard(key)
+            dropped += 1
+        self._expired_since_delete += dropped
+        return dropped
+
+    async def flush(self) -> int:
+        """Writes every new cooldown and deletes expired rows. Returns the number of rows written."""
+        async with self._flush_lock:
+            written = 0
+            if self._dirty:
+                keys, self._dirty = self._dirty, set()
+                rows = [
+                    (user_id, server_id, name, self._expires[(name, server_id, user_id)])
+                    for name, server_id, user_id in keys
+                    if (name, server_id, user_id) in self._expires
+                ]
+                try:
+                    await self.database.upsert_cooldowns(rows)
+                except BaseException:
+                    # Keep them dirty so the next flush retries them, also when cancelled
+                    self._dirty |= {key for key in keys if key in self._expires}
+                    raise
+                written = len(rows)
+            if self._released:
+                released, self._released = self._released, set()
+                try:
+                    await self.database.delete_cooldowns(
+                        [(user_id, server_id, name) for name, server_id, user_id in released]
+                    )
+                except BaseException:
+                    # Unless claimed again meanwhile
+                    self._released |= {key for key in released if key not in self._expires}
+                    raise
+            if self._expired_since_delete:
+                # One range delete for everything swept since the last one
+                await self.database.delete_expired_cooldowns(time.time())
+                self._expired_since_delete = 0
+            return written
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                while self.sweep() == self.sweep_batch:
+                    await asyncio.sleep(0)
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Cooldown flush failed: {e}")
@@ -1,12 +1,15 @@
-
 """
 Copyright (c) 2024 GN027C (GNBot)
 Licensed under the Apache License 2.0.
 Based on work by Krypton.
 """
 
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
 
 class LoggingFormatter(logging.Formatter):
@@ -29,34 +32,105 @@ class LoggingFormatter(logging.Formatter):
         logging.CRITICAL: red + bold,
     }
 
+    def __init__(self):
+        super().__init__()
+        # One compiled formatter per level instead of rebuilding it for every record
+        self.formatters = {}
+        for level, log_color in self.COLORS.items():
+            format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) (green){name}(reset) {message}"
+            format = format.replace("(black)", self.black + self.bold)
+            format = format.replace("(reset)", self.reset)
+            format = format.replace("(levelcolor)", log_color)
+            format = format.replace("(green)", self.green + self.bold)
+            self.formatters[level] = logging.Formatter(format, "%Y-%m-%d %H:%M:%S", style="{")
+
     def format(self, record):
-        log_color = self.COLORS[record.levelno]
-        format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) (green){name}(reset) {message}"
-        format = format.replace("(black)", self.black + self.bold)
-        format = format.replace("(reset)", self.reset)
-        format = format.replace("(levelcolor)", log_color)
-        format = format.replace("(green)", self.green + self.bold)
-        formatter = logging.Formatter(format, "%Y-%m-%d %H:%M:%S", style="{")
+        formatter = self.formatters.get(record.levelno) or self.formatters[logging.INFO]
         return formatter.format(record)
 
-def setup_logging() -> logging.Logger:
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log ingestion."""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for a listener in the same process: keeps exc_info for the formatters."""
+    def prepare(self, record):
+        # Render the arguments now, they may change before the listener runs
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Background thread that writes queued records, see setup_logging()
+_listener = None
+
+def setup_logging(
+    log_file: str = "discord.log",
+    log_format: str = "text",
+    rotation: str = None,
+    max_bytes: int = 10485760,
+    backup_count: int = 5,
+    when: str = "midnight",
+) -> logging.Logger:
+    """
+    Configures the "gnbot" logger. Records are handed to a queue on the event
+    loop and written to the console and log file by a listener thread.
+    rotation: None truncates the file on start, "size" rotates at max_bytes,
+    "time" rotates on the `when` schedule.
+    """
+    global _listener
     logger = logging.getLogger("gnbot")
     logger.setLevel(logging.INFO)
+    if _listener:
+        # Called again (e.g. a new bot in the same process), replace the pipeline
+        _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
 
     # Console handler
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(LoggingFormatter())
-    
+    console_handler.setFormatter(JsonFormatter() if log_format == "json" else LoggingFormatter())
+
     # File handler
-    log_file = "discord.log"
-    file_handler = logging.FileHandler(filename=log_file, encoding="utf-8", mode="w")
-    file_handler_formatter = logging.Formatter(
-        "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
-    )
+    if rotation == "size":
+        file_handler = logging.handlers.RotatingFileHandler(
+            filename=log_file, encoding="utf-8", maxBytes=max_bytes, backupCount=backup_count
+        )
+    elif rotation == "time":
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            filename=log_file, encoding="utf-8", when=when, backupCount=backup_count
+        )
+    else:
+        file_handler = logging.FileHandler(filename=log_file, encoding="utf-8", mode="w")
+    if log_format == "json":
+        file_handler_formatter = JsonFormatter()
+    else:
+        file_handler_formatter = logging.Formatter(
+            "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
+        )
     file_handler.setFormatter(file_handler_formatter)
 
-    # Add the handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    
+    # The event loop only enqueues, console and disk I/O happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(LocalQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+
     return logger
+
+def stop_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
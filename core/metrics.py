@@ -0,0 +1,164 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+from array import array
+from bisect import bisect_left
+
+from aiohttp import web
+
+# Upper bounds in seconds, roughly x2.5 apart from 0.1 ms to 30 s
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with call and error counting."""
+    __slots__ = ("counts", "count", "calls", "errors", "total")
+
+    def __init__(self) -> None:
+        self.counts = array('Q', [0] * (len(BUCKETS) + 1)) # Last slot is +Inf
+        self.count = 0 # Timed observations
+        self.calls = 0 # Including untimed ones, e.g. commands rejected before invoke
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        """Records one call. seconds=None counts it without a latency sample."""
+        self.calls += 1
+        if error:
+            self.errors += 1
+        if seconds is None:
+            return
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q: float) -> float:
+        """Estimates the q-th quantile (0 < q <= 1) by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1] # Only known to be above the last bound
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.errors / self.calls if self.calls else 0.0,
+            "avg_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+        }
+
+class Metrics:
+    """
+    Latency histograms keyed by (kind, name), e.g. ("command", "rank"),
+    ("listener", "Leveling.on_message") or ("db", "get_balance").
+    """
+    def __init__(self) -> None:
+        self.histograms = {} # {(kind, name): LatencyHistogram}
+        self.queues = {} # {name: core.scheduler.WorkQueue}, registered by the queues themselves
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False) -> None:
+        histogram = self.histograms.get((kind, name))
+        if histogram is None:
+            histogram = self.histograms[(kind, name)] = LatencyHistogram()
+        histogram.observe(seconds, error)
+
+    def summary(self, kind: str = None) -> dict:
+        """{(kind, name): summary}, optionally for one kind only."""
+        return {
+            key: histogram.summary()
+            for key, histogram in sorted(self.histograms.items())
+            if kind is None or key[0] == kind
+        }
+
+    def prometheus_text(self) -> str:
+        """Renders every histogram in the Prometheus text exposition format."""
+        lines = [
+            "# HELP gnbot_latency_seconds Latency of commands, listeners and database calls.",
+            "# TYPE gnbot_latency_seconds histogram",
+        ]
+        calls = [
+            "# HELP gnbot_calls_total Commands, listeners and database calls, timed or not.",
+            "# TYPE gnbot_calls_total counter",
+        ]
+        errors = [
+            "# HELP gnbot_errors_total Failed commands, listeners and database calls.",
+            "# TYPE gnbot_errors_total counter",
+        ]
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, histogram.counts):
+                cumulative += n
+                lines.append(f'gnbot_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'gnbot_latency_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"gnbot_latency_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"gnbot_latency_seconds_count{{{labels}}} {histogram.count}")
+            calls.append(f"gnbot_calls_total{{{labels}}} {histogram.calls}")
+            errors.append(f"gnbot_errors_total{{{labels}}} {histogram.errors}")
+        return "\n".join(lines + calls + errors + self._queue_lines()) + "\n"
+
+    def _queue_lines(self) -> list:
+        if not self.queues:
+            return []
+        lines = [
+            "# HELP gnbot_queue_depth Items waiting in a work queue.",
+            "# TYPE gnbot_queue_depth gauge",
+        ]
+        lines += [f'gnbot_queue_depth{{queue="{_escape(name)}"}} {queue.depth}' for name, queue in sorted(self.queues.items())]
+        for counter, help_text in (
+            ("submitted", "Work submitted to a queue."),
+            ("coalesced", "Work merged into an item that was already queued."),
+            ("shed", "Work dropped because the queue was full."),
+        ):
+            lines.append(f"# HELP gnbot_queue_{counter}_total {help_text}")
+            lines.append(f"# TYPE gnbot_queue_{counter}_total counter")
+            lines += [
+                f'gnbot_queue_{counter}_total{{queue="{_escape(name)}"}} {getattr(queue, counter)}'
+                for name, queue in sorted(self.queues.items())
+            ]
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsServer:
+    """Serves Metrics.prometheus_text() on http://host:port/metrics."""
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9108) -> None:
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.metrics.prometheus_text(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
@@ -0,0 +1,145 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("gnbot")
+
+# What submit() does when the queue is full and the key isn't already pending
+POLICIES = ("wait", "drop")
+
+class WorkQueue:
+    """
+    Bounded, keyed work queue drained by a fixed pool of worker tasks.
+    Work for a key that is already queued is merged into the pending item
+    instead of taking another slot, so a flood for one user costs one job.
+    When full, new keys either wait for space ("wait") or are shed ("drop").
+    """
+    def __init__(
+        self,
+        name: str,
+        handler,
+        merge=None,
+        workers: int = 4,
+        max_pending: int = 10000,
+        policy: str = "wait",
+        metrics=None,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.name = name
+        self.handler = handler # async handler(key, payload)
+        self.merge = merge # merge(pending_payload, new_payload) -> payload, None = keep the newest
+        self.workers = workers
+        self.max_pending = max_pending
+        self.policy = policy
+        self.metrics = metrics
+
+        self._pending = {} # {key: payload}, insertion ordered so oldest first
+        self._items = asyncio.Semaphore(0) # One permit per pending key
+        self._space = asyncio.Event()
+        self._space.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._in_flight = 0
+        self._tasks = []
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.processed = 0
+        self.errors = 0
+
+        if metrics is not None:
+            metrics.queues[name] = self
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, key, payload) -> bool:
+        """Queues work for key. Returns False if it was shed."""
+        self.submitted += 1
+        if key in self._pending:
+            pending = self._pending[key]
+            self._pending[key] = self.merge(pending, payload) if self.merge else payload
+            self.coalesced += 1
+            return True
+
+        while len(self._pending) >= self.max_pending:
+            if self.policy == "drop":
+                self.shed += 1
+                return False
+            self._space.clear()
+            await self._space.wait()
+            if key in self._pending:
+                # Queued by someone else while we waited, merge instead
+                return await self.submit(key, payload)
+
+        if not self._tasks:
+            self.start()
+        self._pending[key] = payload
+        self._idle.clear()
+        self._items.release()
+        return True
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"gnbot-{self.name}-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def drain(self) -> None:
+        """Waits until every queued item has been handled."""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        """Handles what is still queued, then stops the workers."""
+        if self._pending and not self._tasks:
+            self.start()
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            await self._items.acquire()
+            key = next(iter(self._pending))
+            payload = self._pending.pop(key)
+            self._space.set()
+            self._in_flight += 1
+            started = time.perf_counter()
+            error = False
+            try:
+                await self.handler(key, payload)
+            except Exception as e:
+                error = True
+                self.errors += 1
+                logger.error(f"{self.name} queue: handler failed for {key}: {e}")
+            finally:
+                self._in_flight -= 1
+                self.processed += 1
+                if self.metrics is not None:
+                    self.metrics.observe("queue", self.name, time.perf_counter() - started, error)
+                if not self._pending and not self._in_flight:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_pending": self.max_pending,
+            "in_flight": self._in_flight,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "shed": self.shed,
+            "processed": self.processed,
+            "errors": self.errors,
+        }
@@ -0,0 +1,62 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import time
+from array import array
+from collections import Counter
+
+class ShardMetrics:
+    """
+    Per-shard gateway event counters.
+    Keeps lifetime totals per event plus a one-minute sliding window
+    (one bucket per second) for the current event rate.
+    """
+    WINDOW = 60
+
+    def __init__(self) -> None:
+        self.totals = {} # {shard_id: Counter(event -> count)}
+        self._counts = {} # {shard_id: array of per-second counts}
+        self._seconds = {} # {shard_id: array of the second each bucket holds}
+
+    def record(self, shard_id: int, event: str) -> None:
+        now = int(time.monotonic())
+        counts = self._counts.get(shard_id)
+        if counts is None:
+            counts = self._counts[shard_id] = array('L', [0] * self.WINDOW)
+            self._seconds[shard_id] = array('q', [0] * self.WINDOW)
+            self.totals[shard_id] = Counter()
+
+        slot = now % self.WINDOW
+        seconds = self._seconds[shard_id]
+        if seconds[slot] != now:
+            # Bucket belongs to an older minute, recycle it
+            seconds[slot] = now
+            counts[slot] = 0
+        counts[slot] += 1
+        self.totals[shard_id][event] += 1
+
+    def rate(self, shard_id: int) -> float:
+        """Events per second over the last minute."""
+        counts = self._counts.get(shard_id)
+        if counts is None:
+            return 0.0
+        oldest = int(time.monotonic()) - self.WINDOW
+        seconds = self._seconds[shard_id]
+        return sum(c for c, s in zip(counts, seconds) if s > oldest) / self.WINDOW
+
+def parse_shard_ids(value: str) -> list:
+    """Parses "0,1,4-7" into [0, 1, 4, 5, 6, 7]. Empty means None."""
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return shard_ids
@@ -0,0 +1,33 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import time
+from contextlib import contextmanager
+
+class StartupTimer:
+    """
+    Collects how long each startup phase took and logs them as one report,
+    so cold-start regressions show up in the log.
+    """
+    def __init__(self) -> None:
+        self.phases = [] # [(name, seconds)] in completion order
+        self.started = time.perf_counter()
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self, logger) -> None:
+        total = time.perf_counter() - self.started
+        lines = [f"  {name:<24} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        logger.info("Startup timing:\n" + "\n".join(lines) + f"\n  {'total since init':<24} {total * 1000:8.1f} ms")
@@ -5,4 +5,6 @@ Licensed under the Apache License 2.0.
 Based on work by Krypton.
 """
 
-from .manager import DatabaseManager
+from .backends import PostgresBackend, SQLiteBackend, StorageBackend, backend_from_config
+from .ledger import EconomyLedger
+from .manager import DatabaseManager, InsufficientFunds
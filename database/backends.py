@@ -0,0 +1,499 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import aiosqlite
+import asyncio
+import contextvars
+import itertools
+import os
+import re
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from urllib.parse import quote
+
+# Set while the current task is inside SQLiteBackend.transaction()
+_in_transaction = contextvars.ContextVar("gnbot_in_transaction", default=False)
+# Connection owned by the current task's PostgresBackend.transaction()
+_pg_connection = contextvars.ContextVar("gnbot_pg_connection", default=None)
+
+# Storage profile applied to every connection (PRAGMA name -> value)
+DEFAULT_STORAGE_PROFILE = {
+    "busy_timeout": 5000,        # ms to wait on a locked database before failing
+    "journal_mode": "WAL",       # Readers don't block the writer and vice versa
+    "synchronous": "NORMAL",     # Safe with WAL, skips an fsync per commit
+    "mmap_size": 268435456,      # 256 MiB memory-mapped reads
+    "cache_size": -65536,        # Negative = KiB, so 64 MiB page cache
+}
+
+# PRAGMAs that only make sense on the writer connection
+_WRITER_ONLY_PRAGMAS = ("journal_mode", "synchronous")
+
+@lru_cache(maxsize=512)
+def is_read_query(query: str) -> bool:
+    """True if the statement only reads, so it can run on a read-only connection."""
+    words = query.lstrip().split(None, 1)
+    if not words:
+        return False
+    return words[0].upper() in ("SELECT", "WITH", "EXPLAIN") and "RETURNING" not in query.upper()
+
+# A ? only counts as a placeholder outside of these
+_PLACEHOLDER_TOKENS = re.compile(
+    r"'(?:[^']|'')*'"        # 'string', '' escapes a quote
+    r'|"(?:[^"]|"")*"'       # "identifier"
+    r"|--[^\n]*"             # -- line comment
+    r"|/\*.*?\*/"            # /* block comment */
+    r"|\?",
+    re.DOTALL,
+)
+
+@lru_cache(maxsize=512)
+def to_numbered_placeholders(query: str) -> str:
+    """Rewrites qmark placeholders (?) to PostgreSQL's $1, $2, ..."""
+    counter = itertools.count(1)
+    # Quoted strings, quoted identifiers and comments are copied as they are
+    return _PLACEHOLDER_TOKENS.sub(
+        lambda match: f"${next(counter)}" if match.group() == "?" else match.group(),
+        query,
+    )
+
+class StorageBackend(ABC):
+    """
+    Connection-level operations DatabaseManager delegates to.
+    Queries are written with qmark (?) placeholders, backends translate as needed.
+    Subclasses must implement every method, or they can't be instantiated.
+    """
+    dialect = None
+    integrity_errors = () # Exception types raised when a constraint rejects a write
+
+    @abstractmethod
+    async def connect(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def execute(self, query: str, parameters: tuple = ()) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def execute_many(self, query: str, parameters: list) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_one(self, query: str, parameters: tuple = ()):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_all(self, query: str, parameters: tuple = ()) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def transaction(self):
+        """Async context manager. Nested blocks join the outer transaction."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def schema_version(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def apply_migration(self, version: int, description: str, script: str) -> None:
+        """Runs one migration script and records its version in a single transaction."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def explain(self, query: str) -> list:
+        """Returns the plan of a query as [(detail, is_full_scan)]."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def validate(self, query: str) -> None:
+        """Prepares a query without running it. Raises if it doesn't compile."""
+        raise NotImplementedError
+
+class SQLiteBackend(StorageBackend):
+    """
+    aiosqlite backend: one writer connection plus an optional pool of
+    read-only connections, with optional group commit.
+    """
+    dialect = "sqlite"
+    integrity_errors = (aiosqlite.IntegrityError,)
+
+    def __init__(
+        self,
+        database_path: str,
+        group_commit: bool = False,
+        group_commit_window: float = 0.01,
+        group_commit_max: int = 64,
+        storage_profile: dict = None,
+        read_pool_size: int = 0,
+        statement_cache_size: int = 256,
+    ):
+        self.database_path = database_path
+        self.connection = None
+        self.statement_cache_size = statement_cache_size
+        self.storage_profile = dict(DEFAULT_STORAGE_PROFILE, **(storage_profile or {}))
+
+        # Read-only connections used by fetch_one/fetch_all (WAL only)
+        self.read_pool_size = read_pool_size
+        self._readers = None
+        self._reader_connections = []
+        self._connect_lock = asyncio.Lock()
+
+        # Group commit: writes share one COMMIT per window or per batch of N
+        self.group_commit = group_commit
+        self.group_commit_window = group_commit_window
+        self.group_commit_max = group_commit_max
+        self._write_lock = asyncio.Lock()
+        self._pending_commits = []
+        self._commit_now = asyncio.Event()
+        self._commit_task = None
+
+    async def connect(self) -> None:
+        """Initializes the writer connection and the read pool."""
+        if self.connection:
+            return
+        async with self._connect_lock:
+            if self.connection:
+                return
+            connection = await aiosqlite.connect(self.database_path, cached_statements=self.statement_cache_size)
+            connection.row_factory = aiosqlite.Row
+            await self._apply_profile(connection, writer=True)
+            await connection.execute("PRAGMA foreign_keys = ON")
+            self.connection = connection
+
+            if self.read_pool_size > 0 and self._uses_wal():
+                self._readers = asyncio.Queue()
+                uri = f"file:{quote(os.path.realpath(self.database_path))}?mode=ro"
+                for _ in range(self.read_pool_size):
+                    reader = await aiosqlite.connect(uri, uri=True, cached_statements=self.statement_cache_size)
+                    reader.row_factory = aiosqlite.Row
+                    await self._apply_profile(reader, writer=False)
+                    await reader.execute("PRAGMA query_only = ON")
+                    self._reader_connections.append(reader)
+                    self._readers.put_nowait(reader)
+
+    async def _apply_profile(self, connection, writer: bool) -> None:
+        for pragma, value in self.storage_profile.items():
+            if value is None or (not writer and pragma in _WRITER_ONLY_PRAGMAS):
+                continue
+            if not str(value).lstrip("-").isalnum():
+                raise ValueError(f"Invalid value for PRAGMA {pragma}: {value!r}")
+            await connection.execute(f"PRAGMA {pragma} = {value}")
+
+    def _uses_wal(self) -> bool:
+        return (
+            self.database_path != ":memory:"
+            and str(self.storage_profile.get("journal_mode", "")).upper() == "WAL"
+        )
+
+    async def close(self) -> None:
+        """Closes the writer connection and the read pool."""
+        if self.connection:
+            async with self._write_lock:
+                await self._commit_pending()
+            for reader in self._reader_connections:
+                await reader.close()
+            self._reader_connections = []
+            self._readers = None
+            await self.connection.close()
+            self.connection = None
+
+    async def execute(self, query: str, parameters: tuple = ()) -> None:
+        await self._write(query, parameters)
+
+    async def execute_many(self, query: str, parameters: list) -> None:
+        await self._write(query, parameters, many=True)
+
+    async def fetch_one(self, query: str, parameters: tuple = ()) -> aiosqlite.Row:
+        return await self._fetch(query, parameters, "one")
+
+    async def fetch_all(self, query: str, parameters: tuple = ()) -> list:
+        return await self._fetch(query, parameters, "all")
+
+    async def _fetch(self, query: str, parameters: tuple, fetch: str):
+        await self.connect()
+        if not is_read_query(query):
+            # e.g. INSERT ... RETURNING: goes through the write path and commits
+            return await self._write(query, parameters, fetch=fetch)
+        if self._readers is None or _in_transaction.get():
+            # Inside a transaction only the writer sees the uncommitted rows
+            return await self._run(self.connection, query, parameters, fetch=fetch)
+
+        reader = await self._readers.get()
+        try:
+            return await self._run(reader, query, parameters, fetch=fetch)
+        finally:
+            self._readers.put_nowait(reader)
+
+    @staticmethod
+    async def _run(connection, query: str, parameters, many: bool = False, fetch: str = None):
+        if many:
+            await connection.executemany(query, parameters)
+            return None
+        async with connection.execute(query, parameters) as cursor:
+            if fetch == "one":
+                return await cursor.fetchone()
+            if fetch == "all":
+                return await cursor.fetchall()
+            return None
+
+    @asynccontextmanager
+    async def transaction(self):
+        if _in_transaction.get():
+            yield
+            return
+
+        await self.connect()
+        async with self._write_lock:
+            # Settle any group-commit batch first so a rollback can't undo it
+            await self._commit_pending()
+            token = _in_transaction.set(True)
+            try:
+                yield
+            except BaseException:
+                await self.connection.rollback()
+                raise
+            else:
+                await self.connection.commit()
+            finally:
+                _in_transaction.reset(token)
+
+    # --- Schema ---
+
+    async def schema_version(self) -> int:
+        await self.connect()
+        await self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS `schema_version` ("
+            "`version` INTEGER PRIMARY KEY, `description` varchar(200), "
+            "`applied_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        await self.connection.commit()
+        async with self.connection.execute("SELECT MAX(version) AS version FROM schema_version") as cursor:
+            row = await cursor.fetchone()
+        return row['version'] or 0
+
+    async def apply_migration(self, version: int, description: str, script: str) -> None:
+        await self.connect()
+        async with self._write_lock:
+            await self._commit_pending()
+            try:
+                await self.connection.executescript(
+                    f"BEGIN;\n{script}\n"
+                    f"INSERT INTO schema_version(version, description) VALUES ({int(version)}, '{description.replace(chr(39), chr(39) * 2)}');\n"
+                    "COMMIT;"
+                )
+            except Exception:
+                await self.connection.rollback()
+                raise
+
+    async def explain(self, query: str) -> list:
+        await self.connect()
+        async with self.connection.execute(f"EXPLAIN QUERY PLAN {query}", (None,) * query.count("?")) as cursor:
+            details = [row['detail'] for row in await cursor.fetchall()]
+        return [
+            (detail, detail.startswith("SCAN") and "INDEX" not in detail and detail != "SCAN CONSTANT ROW")
+            for detail in details
+        ]
+
+    async def validate(self, query: str) -> None:
+        await self.connect()
+        # EXPLAIN prepares the statement without running it
+        async with self.connection.execute(f"EXPLAIN {query}", (None,) * query.count("?")):
+            pass
+
+    # --- Write path ---
+
+    async def _write(self, query: str, parameters, many: bool = False, fetch: str = None):
+        await self.connect()
+        if _in_transaction.get():
+            # The surrounding transaction() owns the lock and the commit
+            return await self._run(self.connection, query, parameters, many, fetch)
+
+        async with self._write_lock:
+            result = await self._run(self.connection, query, parameters, many, fetch)
+            if not self.group_commit:
+                await self.connection.commit()
+                return result
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._pending_commits.append(waiter)
+            if len(self._pending_commits) >= self.group_commit_max:
+                self._commit_now.set()
+            if self._commit_task is None:
+                self._commit_task = asyncio.create_task(self._group_commit_worker())
+
+        # Resolves once the batch containing this statement is committed
+        await waiter
+        return result
+
+    async def _group_commit_worker(self) -> None:
+        try:
+            await asyncio.wait_for(self._commit_now.wait(), timeout=self.group_commit_window)
+        except asyncio.TimeoutError:
+            pass
+        async with self._write_lock:
+            await self._commit_pending()
+
+    async def _commit_pending(self) -> None:
+        """Commits the open group-commit batch. Caller must hold the write lock."""
+        waiters, self._pending_commits = self._pending_commits, []
+        self._commit_task = None
+        self._commit_now.clear()
+        if not waiters:
+            return
+
+        try:
+            await self.connection.commit()
+        except Exception as e:
+            await self.connection.rollback()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+class PostgresBackend(StorageBackend):
+    """
+    asyncpg backend: a connection pool shared by every cog, so several
+    bot processes can write to one database concurrently.
+    """
+    dialect = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10, statement_cache_size: int = 256):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.pool = None
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        if self.pool:
+            return
+        try:
+            # Imported on first use so SQLite deployments never load it
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("DB_BACKEND=postgres requires the asyncpg package.")
+        self.integrity_errors = (asyncpg.IntegrityConstraintViolationError,)
+        async with self._connect_lock:
+            if self.pool:
+                return
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                statement_cache_size=self.statement_cache_size,
+            )
+
+    async def close(self) -> None:
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def execute(self, query: str, parameters: tuple = ()) -> None:
+        await self.connect()
+        await self._target().execute(to_numbered_placeholders(query), *parameters)
+
+    async def execute_many(self, query: str, parameters: list) -> None:
+        await self.connect()
+        connection = _pg_connection.get()
+        if connection is not None:
+            await connection.executemany(to_numbered_placeholders(query), parameters)
+            return
+        # Pool.executemany runs in an implicit transaction of its own
+        await self.pool.executemany(to_numbered_placeholders(query), parameters)
+
+    async def fetch_one(self, query: str, parameters: tuple = ()):
+        await self.connect()
+        return await self._target().fetchrow(to_numbered_placeholders(query), *parameters)
+
+    async def fetch_all(self, query: str, parameters: tuple = ()) -> list:
+        await self.connect()
+        return await self._target().fetch(to_numbered_placeholders(query), *parameters)
+
+    def _target(self):
+        # Inside a transaction every statement must use its connection
+        connection = _pg_connection.get()
+        return connection if connection is not None else self.pool
+
+    @asynccontextmanager
+    async def transaction(self):
+        if _pg_connection.get() is not None:
+            yield
+            return
+
+        await self.connect()
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                token = _pg_connection.set(connection)
+                try:
+                    yield
+                finally:
+                    _pg_connection.reset(token)
+
+    # --- Schema ---
+
+    async def schema_version(self) -> int:
+        await self.connect()
+        await self.pool.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, description varchar(200), "
+            "applied_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        return await self.pool.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+    async def apply_migration(self, version: int, description: str, script: str) -> None:
+        await self.connect()
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                # Without arguments asyncpg runs a multi-statement script
+                await connection.execute(script)
+                await connection.execute(
+                    "INSERT INTO schema_version(version, description) VALUES ($1, $2)", version, description
+                )
+
+    async def explain(self, query: str) -> list:
+        await self.connect()
+        rows = await self.pool.fetch(f"EXPLAIN {to_numbered_placeholders(query)}", *(None,) * query.count("?"))
+        return [(row[0], "Seq Scan" in row[0]) for row in rows]
+
+    async def validate(self, query: str) -> None:
+        await self.connect()
+        async with self.pool.acquire() as connection:
+            await connection.prepare(to_numbered_placeholders(query))
+
+def backend_from_config(config) -> StorageBackend:
+    """Builds the backend selected by DB_BACKEND from a core.config.Config."""
+    if config.db_backend == "postgres":
+        return PostgresBackend(
+            config.database_url,
+            min_size=config.db_pool_min_size,
+            max_size=config.db_pool_max_size,
+            statement_cache_size=config.db_statement_cache_size,
+        )
+    # File based DB next to this module
+    return SQLiteBackend(
+        os.path.join(os.path.dirname(os.path.realpath(__file__)), "database.db"),
+        group_commit=config.db_group_commit,
+        group_commit_window=config.db_group_commit_window,
+        group_commit_max=config.db_group_commit_max,
+        storage_profile={
+            "busy_timeout": config.db_busy_timeout,
+            "journal_mode": config.db_journal_mode,
+            "synchronous": config.db_synchronous,
+            "mmap_size": config.db_mmap_size,
+            "cache_size": config.db_cache_size,
+        },
+        read_pool_size=config.db_read_pool_size,
+        statement_cache_size=config.db_statement_cache_size,
+    )
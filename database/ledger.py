@@ -0,0 +1,234 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger("gnbot")
+
+class EconomyLedger:
+    """
+    Optional in-process cache for economy_users.
+    Balances are read and mutated in memory, every mutation is appended to a
+    journal file, and dirty rows are checkpointed to SQLite in batches.
+    Journal lines are written (and fsynced) off the event loop by a writer
+    task, one batch at a time. A mutation returns once its line is written.
+    """
+    def __init__(self, database, journal_path: str, checkpoint_interval: float = 60.0, fsync_interval: float = 1.0):
+        self.database = database
+        self.journal_path = journal_path
+        self.checkpoint_interval = checkpoint_interval
+        # 0 = fsync on every mutation, otherwise at most this many seconds of writes can be lost
+        self.fsync_interval = fsync_interval
+
+        self._guilds = {} # {server_id: {user_id: [wallet, bank]}}
+        self._dirty = set() # {(server_id, user_id)}
+        self._journal = None
+        self._last_fsync = 0.0
+        self._buffer = [] # Journal lines waiting for the writer task
+        self._written = None # Future resolved once the buffered lines are written
+        self._wakeup = asyncio.Event()
+        self._journal_lock = asyncio.Lock() # Held while a batch is written or the file is rotated
+        self._writer = None
+        self._checkpoint_lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    async def start(self) -> None:
+        """Replays any journal left by a crash, then starts the checkpoint timer."""
+        await self._replay()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._writer = asyncio.create_task(self._writer_loop())
+        self._task = asyncio.create_task(self._checkpoint_loop())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._writer:
+            # Waits for a batch in progress, then writes whatever is left
+            await self._write_buffer()
+            self._writer.cancel()
+            self._writer = None
+        await self.checkpoint()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+            if not self._dirty:
+                os.remove(self.journal_path)
+
+    async def get(self, user_id: int, server_id: int) -> dict:
+        entry = await self._load(user_id, server_id)
+        return {"wallet": entry[0], "bank": entry[1]}
+
+    async def adjust(self, user_id: int, server_id: int, wallet: int, bank: int) -> dict:
+        """
+        Applies the deltas in memory. Returns None if either balance would go negative.
+        Raises if the journal write fails, with the deltas taken back.
+        """
+        entry = await self._load(user_id, server_id)
+        if entry[0] + wallet < 0 or entry[1] + bank < 0:
+            return None
+        entry[0] += wallet
+        entry[1] += bank
+        result = {"wallet": entry[0], "bank": entry[1]}
+        written = self._record(server_id, user_id, entry)
+        if written is not None:
+            try:
+                # Shielded, the future is shared with every mutation in the same batch
+                await asyncio.shield(written)
+            except Exception:
+                if entry[0] - wallet < 0 or entry[1] - bank < 0:
+                    # Already spent by a later change, so it has to stay. Not
+                    # journaled, but dirty: the next checkpoint persists it.
+                    logger.error(f"Kept unjournaled ledger change for user {user_id} in {server_id}")
+                    return result
+                entry[0] -= wallet
+                entry[1] -= bank
+                # In case part of the failed batch reached the file, replay must end on this value
+                self._record(server_id, user_id, entry)
+                raise
+        return result
+
+    async def checkpoint(self) -> int:
+        """Writes every dirty balance in one transaction. Returns the number of rows written."""
+        async with self._checkpoint_lock:
+            # No batch is written while the rows are taken and the file is swapped,
+            # so every line in the old journal is covered by these rows
+            async with self._journal_lock:
+                if not self._dirty:
+                    return 0
+                keys, self._dirty = self._dirty, set()
+                rows = [(user_id, server_id, *self._guilds[server_id][user_id]) for server_id, user_id in keys]
+                # Start a fresh journal for mutations that land while we write.
+                # The old one is only removed once its rows are committed.
+                self._rotate_journal()
+            try:
+                await self.database.upsert_balances(rows)
+            except Exception:
+                self._dirty |= keys
+                raise
+            # Journals left by failed checkpoints go too, their rows were dirtied
+            # again and are part of this commit
+            for path in self._journal_files():
+                if path != self.journal_path:
+                    os.remove(path)
+            return len(rows)
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                # Rows stay dirty and journaled, the next tick retries
+                logger.error(f"Economy ledger checkpoint failed: {e}")
+
+    async def _load(self, user_id: int, server_id: int) -> list:
+        guild = self._guilds.setdefault(server_id, {})
+        entry = guild.get(user_id)
+        if entry is not None:
+            return entry
+
+        row = await self.database.fetch_one_named("get_balance", (user_id, server_id))
+        # Another coroutine may have loaded the same user while we awaited
+        entry = guild.get(user_id)
+        if entry is None:
+            entry = [row['wallet'], row['bank']] if row else [0, 0]
+            guild[user_id] = entry
+        return entry
+
+    def _record(self, server_id: int, user_id: int, entry: list):
+        """Marks the row dirty and queues its journal line. Returns a future for the write, if journaling."""
+        self._dirty.add((server_id, user_id))
+        if not self._journal:
+            return None
+        # Absolute values, so replaying a line twice is harmless
+        self._buffer.append(f"{server_id} {user_id} {entry[0]} {entry[1]}\n")
+        if self._written is None:
+            self._written = asyncio.get_running_loop().create_future()
+        self._wakeup.set()
+        return self._written
+
+    async def _writer_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self._write_buffer()
+
+    async def _write_buffer(self) -> None:
+        async with self._journal_lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            written, self._written = self._written, None
+            now = time.monotonic()
+            fsync = now - self._last_fsync >= self.fsync_interval
+            try:
+                await asyncio.to_thread(self._write_lines, self._journal, "".join(lines), fsync)
+            except Exception as e:
+                # The balances are still dirty, so the next checkpoint persists them
+                logger.error(f"Economy journal write failed: {e}")
+                written.set_exception(e)
+                written.exception() # Already logged, don't warn again if nobody awaits it
+                return
+            if fsync:
+                self._last_fsync = now
+            written.set_result(None)
+
+    @staticmethod
+    def _write_lines(journal, data: str, fsync: bool) -> None:
+        journal.write(data)
+        journal.flush()
+        if fsync:
+            os.fsync(journal.fileno())
+
+    def _rotate_journal(self) -> str:
+        if not self._journal:
+            return None
+        self._journal.close()
+        rotated = f"{self.journal_path}.{time.time_ns()}"
+        os.replace(self.journal_path, rotated)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return rotated
+
+    def _journal_files(self) -> list:
+        directory = os.path.dirname(self.journal_path) or "."
+        prefix = os.path.basename(self.journal_path) + "."
+        rotated = sorted(
+            (name for name in os.listdir(directory) if name.startswith(prefix) and name[len(prefix):].isdigit()),
+            key=lambda name: int(name[len(prefix):])
+        )
+        files = [os.path.join(directory, name) for name in rotated]
+        if os.path.exists(self.journal_path):
+            files.append(self.journal_path)
+        return files
+
+    async def _replay(self) -> None:
+        files = self._journal_files()
+        if not files:
+            return
+
+        latest = {}
+        for path in files:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if not line.endswith("\n") or len(parts) != 4:
+                        continue # Torn write at the tail
+                    server_id, user_id, wallet, bank = map(int, parts)
+                    latest[(server_id, user_id)] = (wallet, bank)
+
+        await self.database.upsert_balances(
+            [(user_id, server_id, wallet, bank) for (server_id, user_id), (wallet, bank) in latest.items()]
+        )
+        for path in files:
+            os.remove(path)
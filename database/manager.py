@@ -1,121 +1,506 @@
-
 """
 Copyright (c) 2024 GN027C (GNBot)
 Licensed under the Apache License 2.0.
 Based on work by Krypton.
 """
 
-import aiosqlite
-import os
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from .backends import SQLiteBackend, StorageBackend
+from .ledger import EconomyLedger
+from .migrations import MIGRATIONS, migration_script
+
+logger = logging.getLogger("gnbot")
+
+# In-memory changes to undo if the current transaction rolls back
+_rollback_hooks = contextvars.ContextVar("gnbot_rollback_hooks", default=None)
+_commit_hooks = contextvars.ContextVar("gnbot_commit_hooks", default=None)
+
+# Hot-path statements, registered by name so the SQL text is identical on every
+# call and stays in the backend's prepared statement cache
+HOT_QUERIES = {
+    "get_level_data": "SELECT xp, level, last_message FROM levels WHERE user_id=? AND server_id=?",
+    "upsert_levels": (
+        "INSERT INTO levels(user_id, server_id, xp, level) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user_id, server_id) DO UPDATE SET xp=excluded.xp, level=excluded.level"
+    ),
+    "leaderboard": "SELECT user_id, level, xp FROM levels WHERE server_id=? ORDER BY xp DESC LIMIT ?",
+    "rank_values": "SELECT user_id, xp FROM levels WHERE server_id=?",
+    "get_balance": "SELECT wallet, bank FROM economy_users WHERE user_id=? AND server_id=?",
+    # Credit/debit in one statement. New rows are only created for non-negative
+    # deltas, existing rows only change if neither balance would go below zero.
+    "adjust_balance": (
+        "INSERT INTO economy_users(user_id, server_id, wallet, bank) "
+        "SELECT ?, ?, ?, ? WHERE (? >= 0 AND ? >= 0) "
+        "OR EXISTS (SELECT 1 FROM economy_users WHERE user_id=? AND server_id=?) "
+        "ON CONFLICT(user_id, server_id) DO UPDATE SET "
+        "wallet = economy_users.wallet + excluded.wallet, bank = economy_users.bank + excluded.bank "
+        "WHERE economy_users.wallet >= -excluded.wallet AND economy_users.bank >= -excluded.bank "
+        "RETURNING wallet, bank"
+    ),
+    # Served by the (server_id, wallet + bank) expression index from migration 6
+    "richest": "SELECT user_id, wallet, bank FROM economy_users WHERE server_id=? ORDER BY wallet + bank DESC LIMIT ?",
+    "upsert_balances": (
+        "INSERT INTO economy_users(user_id, server_id, wallet, bank) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user_id, server_id) DO UPDATE SET wallet=excluded.wallet, bank=excluded.bank"
+    ),
+    "get_guild_settings": "SELECT * FROM guild_settings WHERE server_id=?",
+    "insert_guild_settings": "INSERT INTO guild_settings(server_id) VALUES (?) ON CONFLICT DO NOTHING",
+    "leveling_disabled_guilds": "SELECT server_id FROM guild_settings WHERE leveling_enabled = 0",
+    "get_warnings": "SELECT * FROM warns WHERE user_id=? AND server_id=?",
+    "shop_catalog": "SELECT item_id, name, price, description FROM shop_items WHERE server_id=? ORDER BY item_id",
+    "get_inventory": "SELECT item_id, quantity FROM inventory WHERE user_id=? AND server_id=?",
+    "add_inventory": (
+        "INSERT INTO inventory(user_id, server_id, item_id, quantity) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user_id, server_id, item_id) DO UPDATE SET quantity = inventory.quantity + excluded.quantity"
+    ),
+    "get_cooldowns": "SELECT user_id, server_id, name, expires_at FROM cooldowns WHERE expires_at > ?",
+    "upsert_cooldowns": (
+        "INSERT INTO cooldowns(user_id, server_id, name, expires_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user_id, server_id, name) DO UPDATE SET expires_at=excluded.expires_at"
+    ),
+    "delete_expired_cooldowns": "DELETE FROM cooldowns WHERE expires_at <= ?",
+    "delete_cooldown": "DELETE FROM cooldowns WHERE user_id=? AND server_id=? AND name=?",
+    "get_voice_sessions": "SELECT user_id, server_id, since, saved_at FROM voice_sessions",
+    "insert_voice_session": "INSERT INTO voice_sessions(user_id, server_id, since, saved_at) VALUES (?, ?, ?, ?)",
+}
+
+# Per-dialect replacements for HOT_QUERIES entries that aren't portable
+DIALECT_QUERIES = {
+    "postgres": {
+        # PostgreSQL can't infer the types of bare parameters in a SELECT list
+        "adjust_balance": (
+            "INSERT INTO economy_users(user_id, server_id, wallet, bank) "
+            "SELECT ?::bigint, ?::bigint, ?::bigint, ?::bigint WHERE (?::bigint >= 0 AND ?::bigint >= 0) "
+            "OR EXISTS (SELECT 1 FROM economy_users WHERE user_id=? AND server_id=?) "
+            "ON CONFLICT(user_id, server_id) DO UPDATE SET "
+            "wallet = economy_users.wallet + excluded.wallet, bank = economy_users.bank + excluded.bank "
+            "WHERE economy_users.wallet >= -excluded.wallet AND economy_users.bank >= -excluded.bank "
+            "RETURNING wallet, bank"
+        ),
+    },
+}
+
+class InsufficientFunds:
+    """Returned by DatabaseManager.adjust_balance when a debit would overdraw."""
+    __slots__ = ("wallet", "bank")
+
+    def __init__(self, wallet: int, bank: int):
+        # The deltas that were rejected
+        self.wallet = wallet
+        self.bank = bank
+
+    def __repr__(self) -> str:
+        return f"<InsufficientFunds wallet={self.wallet} bank={self.bank}>"
 
 class DatabaseManager:
     """
     Class to manage database interactions for GNBot.
-    Handles connection lifecycle and common queries.
+    Handles caching and common queries, the connection work is done by a
+    StorageBackend (SQLite by default, PostgreSQL via asyncpg).
     """
-    def __init__(self, database_path: str):
-        self.database_path = database_path
-        self.connection = None
+    def __init__(self, backend, settings_cache_size: int = 1024, **sqlite_options):
+        # A plain path keeps the old DatabaseManager(path, ...) call working
+        if not isinstance(backend, StorageBackend):
+            backend = SQLiteBackend(backend, **sqlite_options)
+        self.backend = backend
+
+        # LRU cache of guild_settings rows: {server_id: settings}
+        self._settings_cache = OrderedDict()
+        self.settings_cache_size = settings_cache_size
+        self.settings_cache_hits = 0
+        self.settings_cache_misses = 0
+
+        # Named queries: {name: sql} and {name: [calls, total_seconds]}
+        self.queries = {}
+        self._query_stats = {}
+        overrides = DIALECT_QUERIES.get(backend.dialect, {})
+        for name, query in HOT_QUERIES.items():
+            self.register_query(name, overrides.get(name, query))
+
+        # Optional in-memory balance cache, see enable_ledger()
+        self.ledger = None
+        # Optional core.metrics.Metrics, every call is recorded under kind "db"
+        self.metrics = None
+        # Called as listener(server_id, user_id, wallet, bank) after every balance change,
+        # once the surrounding transaction (if any) has committed
+        self.balance_listeners = []
+
+    @property
+    def dialect(self) -> str:
+        return self.backend.dialect
+
+    @property
+    def integrity_errors(self) -> tuple:
+        """Exceptions raised when a constraint (foreign key, unique, check) rejects a write."""
+        return self.backend.integrity_errors
 
     async def connect(self):
-        """Initializes the database connection."""
-        if not self.connection:
-            self.connection = await aiosqlite.connect(self.database_path)
-            self.connection.row_factory = aiosqlite.Row 
-            await self.connection.execute("PRAGMA foreign_keys = ON") 
+        await self.backend.connect()
 
     async def close(self):
-        """Closes the database connection."""
-        if self.connection:
-            await self.connection.close()
-            self.connection = None
+        if self.ledger:
+            await self.ledger.close()
+            self.ledger = None
+        await self.backend.close()
 
     async def execute(self, query: str, parameters: tuple = ()) -> None:
         """Executes a query that changes data (INSERT, UPDATE, DELETE)."""
-        await self.connect() 
-        await self.connection.execute(query, parameters)
-        await self.connection.commit()
+        await self._timed("execute", self.backend.execute, query, parameters)
+
+    async def execute_many(self, query: str, parameters: list) -> None:
+        """Executes a query once per parameter set, committing a single time."""
+        await self._timed("execute_many", self.backend.execute_many, query, parameters)
 
-    async def fetch_one(self, query: str, parameters: tuple = ()) -> aiosqlite.Row:
+    async def fetch_one(self, query: str, parameters: tuple = ()):
         """Executes a query and returns one result."""
-        await self.connect()
-        async with self.connection.execute(query, parameters) as cursor:
-            return await cursor.fetchone()
+        return await self._timed("fetch_one", self.backend.fetch_one, query, parameters)
 
     async def fetch_all(self, query: str, parameters: tuple = ()) -> list:
         """Executes a query and returns all results."""
-        await self.connect()
-        async with self.connection.execute(query, parameters) as cursor:
-            return await cursor.fetchall()
-    
+        return await self._timed("fetch_all", self.backend.fetch_all, query, parameters)
+
+    async def _timed(self, name: str, method, query: str, parameters):
+        if self.metrics is None:
+            return await method(query, parameters)
+        started = time.perf_counter()
+        error = False
+        try:
+            return await method(query, parameters)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.metrics.observe("db", name, time.perf_counter() - started, error)
+
+    # --- Schema ---
+
+    async def schema_version(self) -> int:
+        return await self.backend.schema_version()
+
+    async def migrate(self) -> list:
+        """Applies pending migrations in order. Returns the versions that were applied."""
+        current = await self.schema_version()
+        applied = []
+        for version, description, script in MIGRATIONS:
+            if version <= current:
+                continue
+            # One transaction per step, recorded together with its version
+            await self.backend.apply_migration(version, description, migration_script(script, self.dialect))
+            applied.append(version)
+        return applied
+
+    async def explain_queries(self) -> dict:
+        """Returns the plan of every registered query as {name: [(detail, is_full_scan)]}."""
+        return {name: await self.backend.explain(query) for name, query in self.queries.items()}
+
+    # --- Named queries ---
+
+    def register_query(self, name: str, query: str) -> None:
+        """Declares a named query. Call validate_queries() once the schema exists."""
+        self.queries[name] = query
+        self._query_stats.setdefault(name, [0, 0.0])
+
+    async def validate_queries(self) -> None:
+        """Compiles every registered query against the current schema."""
+        errors = []
+        for name, query in self.queries.items():
+            try:
+                await self.backend.validate(query)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+        if errors:
+            raise ValueError("Invalid registered queries:\n" + "\n".join(errors))
+
+    async def execute_named(self, name: str, parameters: tuple = ()) -> None:
+        return await self._named(name, self.backend.execute, parameters)
+
+    async def execute_many_named(self, name: str, parameters: list) -> None:
+        return await self._named(name, self.backend.execute_many, parameters)
+
+    async def fetch_one_named(self, name: str, parameters: tuple = ()):
+        return await self._named(name, self.backend.fetch_one, parameters)
+
+    async def fetch_all_named(self, name: str, parameters: tuple = ()) -> list:
+        return await self._named(name, self.backend.fetch_all, parameters)
+
+    async def _named(self, name: str, method, parameters):
+        query = self.queries[name]
+        started = time.perf_counter()
+        error = False
+        try:
+            return await method(query, parameters)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats = self._query_stats[name]
+            stats[0] += 1
+            stats[1] += elapsed
+            if self.metrics is not None:
+                self.metrics.observe("db", name, elapsed, error)
+
+    def query_stats(self) -> dict:
+        """Returns per-query call counts and cumulative latency."""
+        return {
+            name: {
+                "calls": calls,
+                "total_ms": total * 1000,
+                "avg_ms": (total * 1000 / calls) if calls else 0.0,
+            }
+            for name, (calls, total) in self._query_stats.items()
+        }
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Runs every write inside the block in one transaction with a single commit.
+        Rolls back if the block raises. Nested blocks join the outer transaction.
+        """
+        if _rollback_hooks.get() is not None:
+            yield self
+            return
+
+        hooks_token = _rollback_hooks.set([])
+        commit_token = _commit_hooks.set([])
+        try:
+            async with self.backend.transaction():
+                yield self
+        except BaseException:
+            for hook in reversed(_rollback_hooks.get()):
+                # A failed hook mustn't skip the others or hide the original error
+                try:
+                    await hook()
+                except Exception as e:
+                    logger.error(f"Rollback hook failed: {e}")
+            raise
+        else:
+            for hook in _commit_hooks.get():
+                try:
+                    hook()
+                except Exception as e:
+                    logger.error(f"Commit hook failed: {e}")
+        finally:
+            _commit_hooks.reset(commit_token)
+            _rollback_hooks.reset(hooks_token)
+
+    def _after_commit(self, callback) -> None:
+        """Runs callback once the current transaction commits, or right away outside one."""
+        hooks = _commit_hooks.get()
+        if hooks is None:
+            callback()
+        else:
+            hooks.append(callback)
+
     # --- Helper Methods ---
     
     # WARNS
     async def add_warn(self, user_id: int, server_id: int, moderator_id: int, reason: str) -> int:
-        await self.execute(
-            "INSERT INTO warns(user_id, server_id, moderator_id, reason) VALUES (?, ?, ?, ?)",
+        # RETURNING works on every backend, unlike last_insert_rowid()
+        res = await self.fetch_one(
+            "INSERT INTO warns(user_id, server_id, moderator_id, reason) VALUES (?, ?, ?, ?) RETURNING id",
             (user_id, server_id, moderator_id, reason),
         )
-        res = await self.fetch_one("SELECT last_insert_rowid() as id")
         return res['id']
 
     async def remove_warn(self, warn_id: int) -> None:
         await self.execute("DELETE FROM warns WHERE id=?", (warn_id,))
 
     async def get_warnings(self, user_id: int, server_id: int) -> list:
-        return await self.fetch_all(
-            "SELECT * FROM warns WHERE user_id=? AND server_id=?",
-            (user_id, server_id),
-        )
+        return await self.fetch_all_named("get_warnings", (user_id, server_id))
 
     # ECONOMY
+    async def enable_ledger(self, journal_path: str, checkpoint_interval: float = 60.0, fsync_interval: float = 1.0) -> None:
+        """Serves balances from an in-memory EconomyLedger. Call after the schema exists."""
+        if self.ledger:
+            return
+        ledger = EconomyLedger(self, journal_path, checkpoint_interval, fsync_interval)
+        await ledger.start()
+        self.ledger = ledger
+
     async def get_balance(self, user_id: int, server_id: int) -> dict:
-        result = await self.fetch_one(
-            "SELECT wallet, bank FROM economy_users WHERE user_id=? AND server_id=?",
-            (user_id, server_id)
-        )
+        if self.ledger:
+            return await self.ledger.get(user_id, server_id)
+        result = await self.fetch_one_named("get_balance", (user_id, server_id))
         if result:
             return dict(result)
-        else:
-            await self.execute(
-                "INSERT INTO economy_users(user_id, server_id) VALUES (?, ?)",
-                (user_id, server_id)
-            )
-            return {"wallet": 0, "bank": 0}
+        # The row is created by the first adjust_balance call
+        return {"wallet": 0, "bank": 0}
 
-    async def update_wallet(self, user_id: int, server_id: int, amount: int) -> None:
-        await self.get_balance(user_id, server_id) 
-        await self.execute(
-            "UPDATE economy_users SET wallet = wallet + ? WHERE user_id=? AND server_id=?",
-            (amount, user_id, server_id)
+    async def adjust_balance(self, user_id: int, server_id: int, wallet: int = 0, bank: int = 0):
+        """
+        Atomically adds the given deltas to a user's wallet and bank.
+        Returns the new {"wallet", "bank"} or InsufficientFunds if either would go negative.
+        """
+        if self.ledger:
+            result = await self.ledger.adjust(user_id, server_id, wallet, bank)
+            if result is None:
+                return InsufficientFunds(wallet, bank)
+            hooks = _rollback_hooks.get()
+            if hooks is not None:
+                # The ledger isn't part of the SQL transaction, so undo by hand
+                async def undo():
+                    reverted = await self.ledger.adjust(user_id, server_id, -wallet, -bank)
+                    if reverted is None:
+                        # The balance was spent meanwhile, undoing would make it negative
+                        logger.error(
+                            f"Could not undo ledger change for user {user_id} in {server_id}: "
+                            f"wallet {wallet:+}, bank {bank:+}"
+                        )
+                        # The change stays, so listeners must still see it
+                        self._balance_changed(server_id, user_id, await self.ledger.get(user_id, server_id))
+                hooks.append(undo)
+            self._after_commit(lambda: self._balance_changed(server_id, user_id, result))
+            return result
+
+        result = await self.fetch_one_named(
+            "adjust_balance",
+            (user_id, server_id, wallet, bank, wallet, bank, user_id, server_id)
         )
+        if result is None:
+            return InsufficientFunds(wallet, bank)
+        result = dict(result)
+        # Listeners only hear about committed balances, a rollback needs no undo
+        self._after_commit(lambda: self._balance_changed(server_id, user_id, result))
+        return result
+
+    def _balance_changed(self, server_id: int, user_id: int, balance: dict) -> None:
+        for listener in self.balance_listeners:
+            listener(server_id, user_id, balance['wallet'], balance['bank'])
+
+    async def get_richest(self, server_id: int, limit: int) -> list:
+        """Top (user_id, wallet, bank) rows by net worth."""
+        if self.ledger:
+            # The table lags the ledger until its next checkpoint
+            await self.ledger.checkpoint()
+        return await self.fetch_all_named("richest", (server_id, limit))
+
+    async def upsert_balances(self, rows: list) -> None:
+        """Writes absolute (user_id, server_id, wallet, bank) rows in one transaction."""
+        if not rows:
+            return
+        await self.execute_many_named("upsert_balances", rows)
+
+    async def update_wallet(self, user_id: int, server_id: int, amount: int):
+        return await self.adjust_balance(user_id, server_id, wallet=amount)
 
     # LEVELING
     async def get_level_data(self, user_id: int, server_id: int) -> dict:
-        result = await self.fetch_one(
-            "SELECT xp, level, last_message FROM levels WHERE user_id=? AND server_id=?",
-            (user_id, server_id)
-        )
+        result = await self.fetch_one_named("get_level_data", (user_id, server_id))
         if result:
             return dict(result)
         return None
 
     async def insert_level_user(self, user_id: int, server_id: int):
         await self.execute(
-            "INSERT OR IGNORE INTO levels(user_id, server_id) VALUES (?, ?)",
+            "INSERT INTO levels(user_id, server_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
             (user_id, server_id)
         )
         
+    async def upsert_levels(self, rows: list) -> None:
+        """Writes absolute (user_id, server_id, xp, level) rows in one transaction."""
+        if not rows:
+            return
+        await self.execute_many_named("upsert_levels", rows)
+        
+    # SHOP
+    async def get_shop_items(self, server_id: int) -> list:
+        return await self.fetch_all_named("shop_catalog", (server_id,))
+
+    async def get_inventory(self, user_id: int, server_id: int) -> list:
+        return await self.fetch_all_named("get_inventory", (user_id, server_id))
+
+    async def purchase(self, user_id: int, server_id: int, lines: list):
+        """
+        Debits the total of (item_id, quantity, unit_price) lines and adds them to
+        the inventory in one transaction.
+        Returns the new {"wallet", "bank"} or InsufficientFunds with nothing changed.
+        """
+        total = sum(quantity * price for _, quantity, price in lines)
+        async with self.transaction() as db:
+            result = await db.adjust_balance(user_id, server_id, wallet=-total)
+            if isinstance(result, InsufficientFunds):
+                return result
+            await db.execute_many_named(
+                "add_inventory",
+                [(user_id, server_id, item_id, quantity) for item_id, quantity, _ in lines]
+            )
+        return result
+
+    async def get_voice_sessions(self) -> list:
+        return await self.fetch_all_named("get_voice_sessions")
+
+    async def replace_voice_sessions(self, server_ids: list, rows: list) -> None:
+        """Replaces the snapshot of the given guilds with (user_id, server_id, since, saved_at) rows."""
+        async with self.transaction() as db:
+            await db.execute_many("DELETE FROM voice_sessions WHERE server_id=?", [(server_id,) for server_id in server_ids])
+            if rows:
+                await db.execute_many_named("insert_voice_session", rows)
+
+    # COOLDOWNS
+    async def get_cooldowns(self, now: float) -> list:
+        return await self.fetch_all_named("get_cooldowns", (now,))
+
+    async def upsert_cooldowns(self, rows: list) -> None:
+        """Writes (user_id, server_id, name, expires_at) rows in one transaction."""
+        if not rows:
+            return
+        await self.execute_many_named("upsert_cooldowns", rows)
+
+    async def delete_cooldowns(self, rows: list) -> None:
+        """Deletes (user_id, server_id, name) rows in one transaction."""
+        if not rows:
+            return
+        await self.execute_many_named("delete_cooldown", rows)
+
+    async def delete_expired_cooldowns(self, now: float) -> None:
+        await self.execute_named("delete_expired_cooldowns", (now,))
+
     # SETTINGS (NEW)
     async def get_guild_settings(self, server_id: int) -> dict:
-        result = await self.fetch_one("SELECT * FROM guild_settings WHERE server_id=?", (server_id,))
+        cached = self._settings_cache.get(server_id)
+        if cached is not None:
+            self._settings_cache.move_to_end(server_id)
+            self.settings_cache_hits += 1
+            return dict(cached)
+
+        self.settings_cache_misses += 1
+        result = await self.fetch_one_named("get_guild_settings", (server_id,))
         if result:
-            return dict(result)
+            settings = dict(result)
         else:
             # Defaults
-            await self.execute("INSERT INTO guild_settings(server_id) VALUES (?)", (server_id,))
-            return {"xp_rate_text": 1, "xp_rate_voice": 10, "level_difficulty": 100}
+            await self.execute_named("insert_guild_settings", (server_id,))
+            settings = {"xp_rate_text": 1, "xp_rate_voice": 10, "level_difficulty": 100, "leveling_enabled": 1}
+        self._cache_settings(server_id, settings)
+        return dict(settings)
 
     async def update_guild_setting(self, server_id: int, setting: str, value: int):
         # Valid settings check could be here
         await self.execute(f"UPDATE guild_settings SET {setting} = ? WHERE server_id=?", (value, server_id))
+        # Write-through so the next read doesn't hit the table
+        cached = self._settings_cache.get(server_id)
+        if cached is not None:
+            cached[setting] = value
+
+    def _cache_settings(self, server_id: int, settings: dict) -> None:
+        self._settings_cache[server_id] = settings
+        self._settings_cache.move_to_end(server_id)
+        while len(self._settings_cache) > self.settings_cache_size:
+            self._settings_cache.popitem(last=False)
+
+    def settings_cache_stats(self) -> dict:
+        """Returns hit/miss counters for the guild settings cache."""
+        total = self.settings_cache_hits + self.settings_cache_misses
+        return {
+            "size": len(self._settings_cache),
+            "max_size": self.settings_cache_size,
+            "hits": self.settings_cache_hits,
+            "misses": self.settings_cache_misses,
+            "hit_rate": self.settings_cache_hits / total if total else 0.0,
+        }
@@ -0,0 +1,112 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import os
+
+SCHEMA_DIR = os.path.dirname(os.path.realpath(__file__))
+SCHEMA_PATH = os.path.join(SCHEMA_DIR, "schema.sql")
+POSTGRES_SCHEMA_PATH = os.path.join(SCHEMA_DIR, "schema_postgres.sql")
+
+def _read_schema(path: str = SCHEMA_PATH) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+# Ordered (version, description, sql) steps. Never edit a released step,
+# append a new one instead. The sql may be a callable returning the script,
+# or a {dialect: sql} dict when backends need different statements.
+MIGRATIONS = [
+    (1, "Baseline schema", {
+        "sqlite": _read_schema,
+        "postgres": lambda: _read_schema(POSTGRES_SCHEMA_PATH),
+    }),
+    (2, "Composite indexes for hot lookups", """
+        -- Leaderboard and rank seeding: covers server_id filter, xp ordering and selected columns
+        CREATE INDEX IF NOT EXISTS `idx_levels_server_xp` ON `levels` (`server_id`, `xp` DESC, `user_id`, `level`);
+        CREATE INDEX IF NOT EXISTS `idx_warns_user_server` ON `warns` (`user_id`, `server_id`);
+        CREATE INDEX IF NOT EXISTS `idx_inventory_user_server_item` ON `inventory` (`user_id`, `server_id`, `item_id`);
+        CREATE INDEX IF NOT EXISTS `idx_shop_items_server` ON `shop_items` (`server_id`);
+    """),
+    (3, "Voice session snapshots", {
+        "sqlite": """
+            -- since: time up to which voice XP has already been paid
+            -- saved_at: when the snapshot was taken, so downtime isn't paid out
+            CREATE TABLE IF NOT EXISTS `voice_sessions` (
+              `user_id` varchar(20) NOT NULL,
+              `server_id` varchar(20) NOT NULL,
+              `since` REAL NOT NULL,
+              `saved_at` REAL NOT NULL,
+              PRIMARY KEY (`user_id`, `server_id`)
+            );
+        """,
+        # REAL is single precision in PostgreSQL, too coarse for epoch seconds
+        "postgres": """
+            CREATE TABLE IF NOT EXISTS voice_sessions (
+              user_id BIGINT NOT NULL,
+              server_id BIGINT NOT NULL,
+              since DOUBLE PRECISION NOT NULL,
+              saved_at DOUBLE PRECISION NOT NULL,
+              PRIMARY KEY (user_id, server_id)
+            );
+        """,
+    }),
+    (4, "Per-guild leveling switch", """
+        ALTER TABLE `guild_settings` ADD COLUMN `leveling_enabled` INTEGER DEFAULT 1;
+        -- Only the few disabled guilds are indexed, read once at startup
+        CREATE INDEX IF NOT EXISTS `idx_guild_settings_leveling_disabled` ON `guild_settings` (`server_id`) WHERE `leveling_enabled` = 0;
+    """),
+    (5, "One inventory row per user and item", """
+        -- Fold duplicate rows into the oldest one before making the key unique
+        UPDATE `inventory` SET `quantity` = (
+            SELECT SUM(COALESCE(`dup`.`quantity`, 1)) FROM `inventory` AS `dup`
+            WHERE `dup`.`user_id` = `inventory`.`user_id` AND `dup`.`server_id` = `inventory`.`server_id` AND `dup`.`item_id` = `inventory`.`item_id`
+        )
+        WHERE `id` IN (SELECT MIN(`id`) FROM `inventory` GROUP BY `user_id`, `server_id`, `item_id` HAVING COUNT(*) > 1);
+        DELETE FROM `inventory` WHERE `id` NOT IN (SELECT MIN(`id`) FROM `inventory` GROUP BY `user_id`, `server_id`, `item_id`);
+        -- Replaces the plain index from step 2, and lets purchases upsert
+        DROP INDEX IF EXISTS `idx_inventory_user_server_item`;
+        CREATE UNIQUE INDEX IF NOT EXISTS `idx_inventory_user_server_item_unique` ON `inventory` (`user_id`, `server_id`, `item_id`);
+    """),
+    (6, "Net worth index", """
+        -- Lets ORDER BY wallet + bank read the top rows of a guild instead of sorting all of them
+        CREATE INDEX IF NOT EXISTS `idx_economy_users_server_net_worth` ON `economy_users` (`server_id`, (`wallet` + `bank`) DESC);
+    """),
+    (7, "Persistent command cooldowns", {
+        "sqlite": """
+            -- expires_at: epoch seconds, rows past it are swept in batches
+            CREATE TABLE IF NOT EXISTS `cooldowns` (
+              `user_id` varchar(20) NOT NULL,
+              `server_id` varchar(20) NOT NULL,
+              `name` varchar(32) NOT NULL,
+              `expires_at` REAL NOT NULL,
+              PRIMARY KEY (`user_id`, `server_id`, `name`)
+            );
+            CREATE INDEX IF NOT EXISTS `idx_cooldowns_expires` ON `cooldowns` (`expires_at`);
+        """,
+        "postgres": """
+            CREATE TABLE IF NOT EXISTS cooldowns (
+              user_id BIGINT NOT NULL,
+              server_id BIGINT NOT NULL,
+              name VARCHAR(32) NOT NULL,
+              expires_at DOUBLE PRECISION NOT NULL,
+              PRIMARY KEY (user_id, server_id, name)
+            );
+            CREATE INDEX IF NOT EXISTS idx_cooldowns_expires ON cooldowns (expires_at);
+        """,
+    }),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def migration_script(script, dialect: str) -> str:
+    """Resolves a step's sql for the given backend dialect."""
+    if isinstance(script, dict):
+        script = script[dialect]
+    if callable(script):
+        script = script()
+    if dialect != "sqlite":
+        # Backtick identifier quoting is SQLite/MySQL only
+        script = script.replace("`", "")
+    return script
@@ -0,0 +1,68 @@
+-- PostgreSQL version of schema.sql. Snowflake ids are stored as BIGINT.
+
+-- Warns Table
+CREATE TABLE IF NOT EXISTS warns (
+  id SERIAL PRIMARY KEY,
+  user_id BIGINT NOT NULL,
+  server_id BIGINT NOT NULL,
+  moderator_id BIGINT NOT NULL,
+  reason varchar(255) NOT NULL,
+  created_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Economy: Users
+CREATE TABLE IF NOT EXISTS economy_users (
+  user_id BIGINT NOT NULL,
+  server_id BIGINT NOT NULL,
+  wallet BIGINT DEFAULT 0,
+  bank BIGINT DEFAULT 0,
+  last_daily timestamp,
+  last_work timestamp,
+  PRIMARY KEY (user_id, server_id)
+);
+
+-- Economy: Shop Items
+CREATE TABLE IF NOT EXISTS shop_items (
+  item_id SERIAL PRIMARY KEY,
+  server_id BIGINT NOT NULL,
+  name varchar(50) NOT NULL,
+  description varchar(200),
+  price BIGINT NOT NULL,
+  role_id BIGINT,
+  stock INTEGER DEFAULT -1
+);
+
+-- Economy: Inventory
+CREATE TABLE IF NOT EXISTS inventory (
+  id SERIAL PRIMARY KEY,
+  user_id BIGINT NOT NULL,
+  server_id BIGINT NOT NULL,
+  item_id INTEGER NOT NULL REFERENCES shop_items(item_id) ON DELETE CASCADE,
+  quantity INTEGER DEFAULT 1
+);
+
+-- Leveling: Users
+CREATE TABLE IF NOT EXISTS levels (
+  user_id BIGINT NOT NULL,
+  server_id BIGINT NOT NULL,
+  xp BIGINT DEFAULT 0,
+  level INTEGER DEFAULT 0,
+  last_message timestamp,
+  PRIMARY KEY (user_id, server_id)
+);
+
+-- Leveling: Rewards
+CREATE TABLE IF NOT EXISTS level_rewards (
+  server_id BIGINT NOT NULL,
+  level_req INTEGER NOT NULL,
+  role_id BIGINT NOT NULL,
+  PRIMARY KEY (server_id, level_req)
+);
+
+-- Settings: Guild Configuration
+CREATE TABLE IF NOT EXISTS guild_settings (
+  server_id BIGINT PRIMARY KEY,
+  xp_rate_text INTEGER DEFAULT 1,
+  xp_rate_voice INTEGER DEFAULT 10,
+  level_difficulty INTEGER DEFAULT 100
+);
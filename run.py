@@ -9,6 +9,9 @@ Based on work by Krypton.
 GNBot - Custom Discord Bot
 Entry Point
 """
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import asyncio
 import os
 import sys
@@ -16,11 +19,14 @@ import sys
 # Ensure the core module is accessible found
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from core.bot import GNBot
 from core.config import config
 
 async def main():
+    from core.bot import GNBot
+    import_time = time.perf_counter() - IMPORT_STARTED
+
     bot = GNBot()
+    bot.startup.record("import", import_time)
     # Validate token existence before running
     if not config.token:
         print("Error: TOKEN not found in .env file.")
@@ -31,7 +37,12 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if config.cluster_workers > 1:
+            # One process per shard range, supervised by this one
+            from core.cluster import run_cluster
+            run_cluster()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         # User pressed Ctrl+C
         pass
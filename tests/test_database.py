@@ -0,0 +1,170 @@
+"""
+Copyright (c) 2024 GN027C (GNBot)
+Licensed under the Apache License 2.0.
+Based on work by Krypton.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Run from anywhere, like run.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager, InsufficientFunds, PostgresBackend, StorageBackend
+from database.backends import to_numbered_placeholders
+from database.migrations import LATEST_VERSION
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def open_database(path) -> DatabaseManager:
+    database = DatabaseManager(str(path / "test.db"))
+    await database.connect()
+    await database.migrate()
+    return database
+
+# --- Placeholders ---
+
+def test_placeholders_are_numbered_in_order():
+    assert to_numbered_placeholders("SELECT * FROM t WHERE a=? AND b=?") == "SELECT * FROM t WHERE a=$1 AND b=$2"
+
+def test_placeholders_skip_strings_identifiers_and_comments():
+    query = "SELECT '?', 'it''s ?', \"col?\" FROM t -- why?\nWHERE a=? /* or ? */ AND b=?::bigint"
+    assert to_numbered_placeholders(query) == (
+        "SELECT '?', 'it''s ?', \"col?\" FROM t -- why?\nWHERE a=$1 /* or ? */ AND b=$2::bigint"
+    )
+
+# --- Backends ---
+
+def test_incomplete_backend_fails_on_creation():
+    class Incomplete(StorageBackend):
+        async def connect(self) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_postgres_backend_implements_the_interface():
+    # asyncpg is only imported on connect, so this works without it
+    assert PostgresBackend("postgresql://localhost/gnbot").dialect == "postgres"
+
+# --- DatabaseManager ---
+
+def test_migrate_is_idempotent(tmp_path):
+    async def scenario():
+        database = DatabaseManager(str(tmp_path / "test.db"))
+        await database.connect()
+        first = await database.migrate()
+        second = await database.migrate()
+        version = await database.schema_version()
+        await database.validate_queries()
+        await database.close()
+        return first, second, version
+
+    first, second, version = run(scenario())
+    assert first == list(range(1, LATEST_VERSION + 1))
+    assert second == []
+    assert version == LATEST_VERSION
+
+def test_adjust_balance(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path)
+        credited = await database.adjust_balance(1, 10, wallet=500)
+        moved = await database.adjust_balance(1, 10, wallet=-200, bank=200)
+        overdrawn = await database.adjust_balance(1, 10, wallet=-301)
+        unknown = await database.adjust_balance(2, 10, wallet=-1)
+        balance = await database.get_balance(1, 10)
+        await database.close()
+        return credited, moved, overdrawn, unknown, balance
+
+    credited, moved, overdrawn, unknown, balance = run(scenario())
+    assert credited == {"wallet": 500, "bank": 0}
+    assert moved == {"wallet": 300, "bank": 200}
+    assert isinstance(overdrawn, InsufficientFunds)
+    assert isinstance(unknown, InsufficientFunds)
+    assert balance == {"wallet": 300, "bank": 200}
+
+def test_purchase_debits_once_and_upserts_inventory(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path)
+        item = await database.fetch_one(
+            "INSERT INTO shop_items(server_id, name, price, description) VALUES (?, ?, ?, ?) RETURNING item_id",
+            (10, "Cookie", 50, "Test item"),
+        )
+        item_id = item['item_id']
+        await database.adjust_balance(1, 10, wallet=300)
+        first = await database.purchase(1, 10, [(item_id, 2, 50)])
+        second = await database.purchase(1, 10, [(item_id, 3, 50)])
+        too_many = await database.purchase(1, 10, [(item_id, 5, 50)])
+        rows = await database.get_inventory(1, 10)
+        await database.close()
+        return first, second, too_many, [dict(row) for row in rows], item_id
+
+    first, second, too_many, rows, item_id = run(scenario())
+    assert first['wallet'] == 200
+    assert second['wallet'] == 50
+    assert isinstance(too_many, InsufficientFunds)
+    assert rows == [{"item_id": item_id, "quantity": 5}]
+
+def test_purchase_of_deleted_item_rolls_back(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path)
+        await database.adjust_balance(1, 10, wallet=300)
+        try:
+            await database.purchase(1, 10, [(999, 1, 50)])
+        except database.integrity_errors:
+            rejected = True
+        else:
+            rejected = False
+        balance = await database.get_balance(1, 10)
+        await database.close()
+        return rejected, balance
+
+    rejected, balance = run(scenario())
+    assert rejected
+    assert balance == {"wallet": 300, "bank": 0}
+
+def test_balance_listeners_only_see_committed_changes(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path)
+        seen = []
+        database.balance_listeners.append(lambda server_id, user_id, wallet, bank: seen.append((user_id, wallet)))
+        during = None
+        async with database.transaction() as db:
+            await db.adjust_balance(1, 10, wallet=100)
+            during = list(seen)
+        try:
+            async with database.transaction() as db:
+                await db.adjust_balance(2, 10, wallet=50)
+                raise RuntimeError("abort")
+        except RuntimeError:
+            pass
+        await database.adjust_balance(1, 10, wallet=-30)
+        await database.close()
+        return during, seen
+
+    during, seen = run(scenario())
+    assert during == []
+    assert seen == [(1, 100), (1, 70)]
+
+def test_ledger_takes_back_a_change_whose_journal_write_failed(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path)
+        await database.enable_ledger(str(tmp_path / "economy.journal"))
+        await database.adjust_balance(1, 10, wallet=100)
+
+        def fail(journal, data, fsync):
+            raise OSError("disk full")
+
+        database.ledger._write_lines = fail
+        with pytest.raises(OSError):
+            await database.adjust_balance(1, 10, wallet=50)
+        balance = await database.get_balance(1, 10)
+        await database.ledger.close()
+        await database.close()
+        return balance
+
+    assert run(scenario()) == {"wallet": 100, "bank": 0}